@@ -0,0 +1,173 @@
+"""On-disk cache of the ZIP archives of artists and albums.
+
+An archive is cached under a name made of the kind and id of the instance it
+holds and of a fingerprint of its songs, so that a stale archive is never
+served. Archives are also deleted as soon as the instance they hold is saved
+(see the receivers in `models`), and the least recently used ones are pruned
+once the cache grows over `ARCHIVE_CACHE_MAX_SIZE`.
+"""
+
+import glob
+import hashlib
+import itertools
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.servers.basehttp import FileWrapper
+from django.http import HttpResponse, StreamingHttpResponse
+
+from .thumbnails import is_thumbnail
+from .zipstream import CHUNK_SIZE, folder_entries, stream_zip
+
+
+def archive_response(instance, songs):
+    """Return a HTTP response that is a ZIP file of the folder at
+    `instance.filepath` and of the covers of its albums, where `instance` is
+    an artist or an album and `songs` is the queryset of its songs.
+    """
+
+    folder = os.path.join(settings.MEDIA_ROOT, instance.filepath)
+    entries = itertools.chain(
+        (entry for entry in folder_entries(folder)
+         if not is_thumbnail(entry[0])),
+        _cover_entries(instance, folder))
+    if not settings.ARCHIVE_CACHE_DIR:
+        return StreamingHttpResponse(
+            stream_zip(entries), content_type='application/zip')
+
+    path = os.path.join(
+        settings.ARCHIVE_CACHE_DIR,
+        '%s-%s.zip' % (_archive_prefix(instance), fingerprint(songs)))
+    if os.path.exists(path):
+        # Keep track of the last use of the archive for pruning.
+        os.utime(path, None)
+        return _send_file(path)
+
+    return StreamingHttpResponse(
+        _stream_and_cache(stream_zip(entries), path),
+        content_type='application/zip')
+
+
+def _cover_entries(instance, folder):
+    """Generate a `(filename, arcname)` tuple for the cover of each album
+    of `instance` (or of `instance` itself if it is an album) that is not in
+    `folder`, the folder of `instance`, as they are kept in the cover store.
+    """
+    if hasattr(instance, 'albums'):
+        albums = instance.albums.all()
+    else:
+        albums = [instance]
+    root = os.path.dirname(instance.filepath)
+    for album in albums:
+        if not album.cover or not os.path.exists(album.cover.path):
+            continue
+        if album.cover.path.startswith(folder + os.sep):
+            continue
+        extension = os.path.splitext(album.cover.name)[1]
+        arcname = os.path.join(album.filepath, 'cover' + extension)
+        yield album.cover.path, os.path.relpath(arcname, root)
+
+
+def fingerprint(songs):
+    """Return a digest of the songs in the queryset `songs` that changes
+    whenever the content of their archive does.
+    """
+    digest = hashlib.sha1()
+    values = songs.order_by('pk').values_list(
+        'pk', 'bitrate', 'date_modified', 'filefield')
+    for value in values:
+        digest.update(repr(value))
+    return digest.hexdigest()
+
+
+def invalidate(kind, pk):
+    """Delete the cached archives of the artist or album (depending on
+    `kind`) with the given primary key.
+    """
+    if not settings.ARCHIVE_CACHE_DIR:
+        return
+    pattern = os.path.join(
+        settings.ARCHIVE_CACHE_DIR, '%s-%s-*.zip' % (kind, pk))
+    for path in glob.glob(pattern):
+        _remove(path)
+
+
+def prune(max_size=None):
+    """Delete the least recently used archives until the cache takes at
+    most `max_size` bytes (defaults to `ARCHIVE_CACHE_MAX_SIZE`).
+    """
+
+    if max_size is None:
+        max_size = settings.ARCHIVE_CACHE_MAX_SIZE
+
+    archives = []
+    for path in glob.glob(os.path.join(settings.ARCHIVE_CACHE_DIR, '*.zip')):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        archives.append((stat.st_mtime, stat.st_size, path))
+
+    total_size = sum(size for mtime, size, path in archives)
+    for mtime, size, path in sorted(archives):
+        if total_size <= max_size:
+            break
+        _remove(path)
+        total_size -= size
+
+
+def _archive_prefix(instance):
+    return '%s-%s' % (type(instance).__name__.lower(), instance.pk)
+
+
+def _send_file(path):
+    """Return a response sending the file at `path`, leaving the work to
+    the web server if `ARCHIVE_SENDFILE_HEADER` is set.
+    """
+
+    header = settings.ARCHIVE_SENDFILE_HEADER
+    if header == 'X-Accel-Redirect':
+        response = HttpResponse(content_type='application/zip')
+        response[header] = (
+            settings.ARCHIVE_CACHE_URL + os.path.basename(path))
+    elif header:
+        response = HttpResponse(content_type='application/zip')
+        response[header] = path
+    else:
+        response = StreamingHttpResponse(
+            FileWrapper(open(path, 'rb'), CHUNK_SIZE),
+            content_type='application/zip')
+        response['Content-Length'] = os.path.getsize(path)
+    return response
+
+
+def _stream_and_cache(chunks, path):
+    """Generate the given chunks while writing them to the cache. The
+    archive is only moved to `path` once complete.
+    """
+
+    if not os.path.exists(settings.ARCHIVE_CACHE_DIR):
+        os.makedirs(settings.ARCHIVE_CACHE_DIR)
+    tmp = tempfile.NamedTemporaryFile(
+        dir=settings.ARCHIVE_CACHE_DIR, suffix='.part', delete=False)
+    complete = False
+    try:
+        for chunk in chunks:
+            tmp.write(chunk)
+            yield chunk
+        complete = True
+    finally:
+        tmp.close()
+        if complete:
+            os.rename(tmp.name, path)
+            prune()
+        else:
+            _remove(tmp.name)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
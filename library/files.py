@@ -0,0 +1,157 @@
+"""Helpers keeping the files of the media directory where the models expect
+them to be.
+
+Files are relocated with renames, so that their content is never read. The
+directory of an album or artist is moved as a whole, and since the paths
+stored in the database can only be updated once it is moved, the move is
+first recorded in a journal kept in the storage. An interrupted move can
+then be resumed or rolled back by `recover`.
+"""
+
+import errno
+import json
+import logging
+import os
+import tempfile
+import time
+
+from django.core.files.move import file_move_safe
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Name of the directory of the journal, at the root of the storage.
+JOURNAL_DIR = '.relocations'
+
+
+def move_file(fieldfile, name):
+    """Move the file of `fieldfile` to `name` in its storage, and remove the
+    directories that are left empty. If the file was already moved (by an
+    interrupted relocation), only the name of `fieldfile` is updated.
+    """
+
+    old_name = fieldfile.name
+    if old_name == name:
+        return
+    storage = fieldfile.storage
+    if storage.exists(old_name):
+        _rename(storage.path(old_name), storage.path(name))
+        remove_empty_parents(storage, old_name)
+    elif not storage.exists(name):
+        LOGGER.error('Cannot move missing file "%s"' % old_name)
+        return
+    fieldfile.name = name
+
+
+def move_directory(storage, old_name, new_name, update_paths):
+    """Move the directory `old_name` of `storage` to `new_name`, then call
+    `update_paths(old_name, new_name)` to update the paths referring to its
+    content. Returns False (and does nothing) if there is no directory to
+    move or if the destination already exists.
+    """
+
+    src = storage.path(old_name)
+    dst = storage.path(new_name)
+    if not os.path.isdir(src) or os.path.exists(dst):
+        return False
+
+    entry = _write_journal_entry(storage, old_name, new_name)
+    _make_parent(dst)
+    os.rename(src, dst)
+    update_paths(old_name, new_name)
+    os.remove(entry)
+    remove_empty_parents(storage, old_name)
+    return True
+
+
+def recover(storage, update_paths):
+    """Complete or roll back the directory moves of `storage` that were
+    interrupted (see `move_directory`).
+    """
+
+    for entry in _journal_entries(storage):
+        with open(entry) as f:
+            data = json.load(f)
+        old_name, new_name = data['src'], data['dst']
+        src_exists = os.path.exists(storage.path(old_name))
+        dst_exists = os.path.exists(storage.path(new_name))
+
+        if src_exists and not dst_exists:
+            # The directory was not renamed, and the paths still refer to
+            # its original location.
+            LOGGER.info('Rolled back move of "%s"' % old_name)
+        elif dst_exists and not src_exists:
+            update_paths(old_name, new_name)
+            remove_empty_parents(storage, old_name)
+            LOGGER.info(
+                'Completed move of "%s" to "%s"' % (old_name, new_name))
+        else:
+            LOGGER.error(
+                'Cannot recover move of "%s" to "%s"' % (old_name, new_name))
+            continue
+        os.remove(entry)
+
+
+def replace_prefix(name, old_name, new_name):
+    """Return the path `name`, moved from the directory `old_name` to
+    `new_name`. Paths outside of `old_name` are returned unchanged.
+    """
+    if name == old_name:
+        return new_name
+    if name and name.startswith(old_name + os.path.sep):
+        return new_name + name[len(old_name):]
+    return name
+
+
+def remove_empty_parents(storage, name):
+    """Remove the empty directories containing the file `name` of the given
+    storage, up to the root of the storage.
+    """
+    root = os.path.normpath(storage.location)
+    path = os.path.dirname(storage.path(name))
+    while path != root and path.startswith(root):
+        try:
+            os.rmdir(path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                # The directory is not empty.
+                break
+        path = os.path.dirname(path)
+
+
+def _rename(src, dst):
+    _make_parent(dst)
+    # Falls back to a chunked copy if `dst` is on another file system.
+    file_move_safe(src, dst, allow_overwrite=True)
+
+
+def _make_parent(path):
+    directory = os.path.dirname(path)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+
+def _journal_dir(storage):
+    return os.path.join(storage.location, JOURNAL_DIR)
+
+
+def _journal_entries(storage):
+    directory = _journal_dir(storage)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, name)
+                  for name in os.listdir(directory) if name.endswith('.json'))
+
+
+def _write_journal_entry(storage, old_name, new_name):
+    directory = _journal_dir(storage)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    # Entries are named after their creation time, to be recovered in order.
+    fd, entry = tempfile.mkstemp(
+        dir=directory, prefix='%.6f-' % time.time(), suffix='.json')
+    with os.fdopen(fd, 'w') as f:
+        json.dump({'src': old_name, 'dst': new_name}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    return entry
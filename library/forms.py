@@ -0,0 +1,24 @@
+from haystack.forms import SearchForm
+from haystack.inputs import AutoQuery
+from haystack.query import SQ
+
+
+class LibrarySearchForm(SearchForm):
+    """Search form matching the words of the query in the indexed text, as
+    well as the beginnings of words of names and titles, so that partially
+    typed words find results. Results are sorted by relevance.
+    """
+
+    def search(self):
+        if not self.is_valid():
+            return self.no_query_found()
+
+        query = self.cleaned_data.get('q')
+        if not query:
+            return self.no_query_found()
+
+        sqs = self.searchqueryset.filter(
+            SQ(content=AutoQuery(query)) | SQ(autocomplete=query))
+        if self.load_all:
+            sqs = sqs.load_all()
+        return sqs
@@ -0,0 +1,150 @@
+import datetime
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.utils import timezone
+
+from . import update
+from .models import ImportJob
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+def enqueue_update():
+    """Schedule a library update and return its `ImportJob`. If an update
+    is already waiting to be run, that job is returned instead.
+    """
+
+    pending = ImportJob.objects.filter(status=ImportJob.PENDING)[:1]
+    if pending:
+        return pending[0]
+    return ImportJob.objects.create()
+
+
+def claim_next_job():
+    """Mark the oldest pending job as running and return it, or return
+    None if there is no pending job. A job can only be claimed once, even
+    with several workers polling the queue.
+    """
+
+    for job in ImportJob.objects.filter(
+            status=ImportJob.PENDING).order_by('date_created'):
+        now = timezone.now()
+        claimed = ImportJob.objects.filter(
+            pk=job.pk, status=ImportJob.PENDING
+        ).update(status=ImportJob.RUNNING, date_started=now,
+                 date_heartbeat=now, worker=worker_id())
+        if claimed:
+            return ImportJob.objects.get(pk=job.pk)
+    return None
+
+
+def worker_id():
+    """Return the identifier of the current process, recorded in the jobs
+    it runs.
+    """
+    return '%s:%d' % (socket.gethostname(), os.getpid())
+
+
+class Heartbeat(threading.Thread):
+    """Thread recording every `interval` seconds that the job with primary
+    key `job_pk` is still running, until it is stopped.
+    """
+
+    def __init__(self, job_pk, interval):
+        super(Heartbeat, self).__init__(name='import-job-heartbeat')
+        self.daemon = True
+        self.job_pk = job_pk
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self._stopped.wait(self.interval):
+                try:
+                    ImportJob.objects.filter(pk=self.job_pk).update(
+                        date_heartbeat=timezone.now())
+                except DatabaseError as e:
+                    LOGGER.warning('Cannot record heartbeat of import job '
+                                   '%s: %s' % (self.job_pk, e))
+        finally:
+            # Do not keep a database connection open in this thread.
+            connection.close()
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def run_job(job):
+    """Run the library update described by the (claimed) `job`, recording
+    its progress as it goes.
+    """
+
+    def progress(stats):
+        ImportJob.objects.filter(pk=job.pk).update(
+            files_total=stats.total,
+            files_done=stats.processed,
+            errors=stats.failed)
+
+    heartbeat = Heartbeat(job.pk, settings.IMPORT_JOB_HEARTBEAT_INTERVAL)
+    heartbeat.start()
+    try:
+        stats = update.update(progress=progress)
+    except Exception:
+        LOGGER.exception('Import job %s failed' % job.pk)
+        ImportJob.objects.filter(pk=job.pk).update(
+            status=ImportJob.FAILED,
+            date_finished=timezone.now(),
+            message=traceback.format_exc())
+    else:
+        progress(stats)
+        ImportJob.objects.filter(pk=job.pk).update(
+            status=ImportJob.DONE,
+            date_finished=timezone.now(),
+            message=str(stats))
+    finally:
+        heartbeat.stop()
+
+
+def run_pending_jobs():
+    """Run the pending jobs until there are none left."""
+    job = claim_next_job()
+    while job is not None:
+        run_job(job)
+        job = claim_next_job()
+
+
+def abandon_running_jobs():
+    """Mark the jobs left running by a worker that was interrupted as
+    failed, i.e. those whose worker has not recorded a heartbeat for
+    `IMPORT_JOB_TIMEOUT` seconds. The jobs of the other workers are left
+    alone.
+    """
+    now = timezone.now()
+    deadline = now - datetime.timedelta(seconds=settings.IMPORT_JOB_TIMEOUT)
+    ImportJob.objects.filter(
+        status=ImportJob.RUNNING, date_heartbeat__lt=deadline
+    ).update(
+        status=ImportJob.FAILED,
+        date_finished=now,
+        message='The worker running the job was interrupted.')
+
+
+def work(poll_interval=None):
+    """Run the jobs as they are enqueued, forever."""
+
+    if poll_interval is None:
+        poll_interval = settings.IMPORT_WORKER_POLL_INTERVAL
+
+    while True:
+        abandon_running_jobs()
+        run_pending_jobs()
+        time.sleep(poll_interval)
@@ -0,0 +1,154 @@
+import random
+import string
+import time
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+
+from ...models import Album, Artist, Song
+from ...pagination import KeysetPaginator
+
+
+SONGS_PER_ALBUM = 10
+ALBUMS_PER_ARTIST = 10
+
+
+class Command(NoArgsCommand):
+    help = """Time the queries of the import and of the browsing views on a
+synthetic library, added to the database in a transaction that is rolled back
+afterwards. Run it before and after migrating the indexes of the library to
+compare them."""
+
+    option_list = NoArgsCommand.option_list + (
+        make_option(
+            '--songs', type='int', dest='songs', default=200000,
+            help='Number of songs of the synthetic library.'),
+        make_option(
+            '--repeat', type='int', dest='repeat', default=100,
+            help='Number of times each query is run.'),
+    )
+
+    def handle_noargs(self, **options):
+        rand = random.Random(0)
+        with transaction.commit_manually():
+            try:
+                start = time.time()
+                artists, albums = _create_library(options['songs'], rand)
+                self.stdout.write('Created %d songs in %.1fs' % (
+                    options['songs'], time.time() - start))
+
+                for name, query in _get_queries(artists, albums):
+                    start = time.time()
+                    for i in range(options['repeat']):
+                        query(rand)
+                    elapsed = (time.time() - start) / options['repeat']
+                    self.stdout.write(
+                        '%-24s %8.2f ms' % (name, elapsed * 1000))
+            finally:
+                transaction.rollback()
+
+
+def _create_library(songs, rand):
+    """Add a library of `songs` songs to the database. Returns the lists of
+    `(pk, initial)` tuples of the artists, and `(pk, artist pk, title)`
+    tuples of the albums.
+    """
+
+    n_albums = max(1, songs // SONGS_PER_ALBUM)
+    n_artists = max(1, n_albums // ALBUMS_PER_ARTIST)
+    # The synthetic instances are told apart from the actual library by the
+    # prefix of their file path.
+    prefix = 'benchmark-%d' % time.time()
+
+    Artist.objects.bulk_create(
+        [_make_artist(i, prefix, rand) for i in range(n_artists)],
+        batch_size=500)
+    artists = list(Artist.objects.filter(
+        filepath__startswith=prefix).values_list('pk', 'initial'))
+
+    Album.objects.bulk_create(
+        [_make_album(i, artists[i % n_artists][0], prefix, rand)
+         for i in range(n_albums)],
+        batch_size=500)
+    albums = list(Album.objects.filter(
+        filepath__startswith=prefix).values_list('pk', 'artist', 'title'))
+
+    batch = []
+    for i in range(songs):
+        album_pk = albums[i % n_albums][0]
+        batch.append(Song(
+            title=_random_name(rand), album_id=album_pk,
+            track=u'%02d' % (i // n_albums + 1), bitrate=320000,
+            filetype='mp3', filefield='%s/%d.mp3' % (prefix, i)))
+        if len(batch) == 10000:
+            Song.objects.bulk_create(batch, batch_size=500)
+            batch = []
+    Song.objects.bulk_create(batch, batch_size=500)
+    return artists, albums
+
+
+def _make_artist(i, prefix, rand):
+    name = _random_name(rand)
+    return Artist(name=u'%s %d' % (name, i), initial=name[0],
+                  filepath='%s/%d' % (prefix, i))
+
+
+def _make_album(i, artist_pk, prefix, rand):
+    title = _random_name(rand)
+    return Album(title=title, initial=title[0], artist_id=artist_pk,
+                 filepath='%s/album-%d' % (prefix, i),
+                 cover='%s.jpg' % prefix, cover_file_type='jpg')
+
+
+def _random_name(rand):
+    return u''.join(rand.choice(string.ascii_uppercase) for i in range(8))
+
+
+def _get_queries(artists, albums):
+    """Return a list of `(name, query)` tuples, where `query` is a function
+    of a random generator running one of the queries of the import or of
+    the views on the synthetic library.
+    """
+
+    page_size = settings.LIST_PAGE_SIZE
+
+    def album_lookup(rand):
+        # As in `Album.save`.
+        pk, artist_pk, title = rand.choice(albums)
+        list(Album.objects.filter(artist=artist_pk, title=title))
+
+    def artist_albums(rand):
+        pk, initial = rand.choice(artists)
+        list(Album.objects.filter(artist=pk).values_list('pk'))
+
+    def album_songs(rand):
+        pk, artist_pk, title = rand.choice(albums)
+        list(Song.objects.filter(album=pk).values_list('pk'))
+
+    def artist_list(rand):
+        pk, initial = rand.choice(artists)
+        list(Artist.objects.filter(initial=initial)[:page_size])
+
+    def album_list(rand):
+        pk, artist_pk, title = rand.choice(albums)
+        list(Album.objects.filter(initial=title[0])[:page_size])
+
+    def song_list(rand):
+        paginator = KeysetPaginator(
+            Song.objects.all(), ('track', 'title'), page_size)
+        paginator.page()
+
+    def recent_songs(rand):
+        list(Song.objects.order_by('-date_added')[:page_size])
+
+    return [
+        ('album lookup', album_lookup),
+        ('albums of an artist', artist_albums),
+        ('songs of an album', album_songs),
+        ('artist list page', artist_list),
+        ('album list page', album_list),
+        ('song list page', song_list),
+        ('recently added songs', recent_songs),
+    ]
@@ -1,4 +1,5 @@
 import os
+from optparse import make_option
 
 from django.conf import settings
 from django.core.management.base import NoArgsCommand
@@ -9,8 +10,21 @@ from ... import update
 class Command(NoArgsCommand):
     help = 'Import the files in the dropbox folder into the music library.'
 
+    option_list = NoArgsCommand.option_list + (
+        make_option(
+            '--workers', type='int', dest='workers', default=None,
+            help='Number of processes used to read the tags of the files '
+                 '(defaults to the IMPORT_WORKERS setting).'),
+        make_option(
+            '--rescan', action='store_true', dest='rescan', default=False,
+            help='Also read the files that could not be imported by '
+                 'previous runs and were not modified since.'),
+    )
+
     def handle_noargs(self, **options):
-        update.update()
+        stats = update.update(
+            workers=options['workers'], rescan=options['rescan'])
+        self.stdout.write(str(stats))
 
         if os.listdir(settings.DROPBOX):
             self.stdout.write(
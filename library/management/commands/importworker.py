@@ -0,0 +1,26 @@
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from ... import jobs
+
+
+class Command(NoArgsCommand):
+    help = """Run the library updates requested through the web interface.
+By default, wait for new updates forever."""
+
+    option_list = NoArgsCommand.option_list + (
+        make_option(
+            '--once', action='store_true', dest='once', default=False,
+            help='Run the pending updates, then exit.'),
+        make_option(
+            '--interval', type='float', dest='interval', default=None,
+            help='Number of seconds between checks for new updates '
+                 '(defaults to the IMPORT_WORKER_POLL_INTERVAL setting).'),
+    )
+
+    def handle_noargs(self, **options):
+        if options['once']:
+            jobs.run_pending_jobs()
+        else:
+            jobs.work(options['interval'])
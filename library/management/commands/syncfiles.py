@@ -1,17 +1,30 @@
+from optparse import make_option
+
 from django.core.management.base import NoArgsCommand
 
+from ...models import Album, Song
 from ...utils import (
-    delete_empty_instances, remove_empty_directories, sync_cover_images,
-    sync_song_files
-)
+    delete_empty_instances, delete_unused_covers, remove_empty_directories,
+    sync_files)
 
 
 class Command(NoArgsCommand):
-    help = """Delete empty album and artist instances and synchronizes the
-files in the media folder with the models in the music library."""
+    help = """Delete empty album and artist instances and unused covers, and
+synchronizes the files in the media folder with the models in the music
+library."""
+
+    option_list = NoArgsCommand.option_list + (
+        make_option(
+            '--all', action='store_true', dest='all', default=False,
+            help='Check the files of every album and song, not only those '
+                 'flagged as dirty.'),
+    )
 
     def handle_noargs(self, **options):
         delete_empty_instances()
-        sync_song_files()
-        sync_cover_images()
+        if options['all']:
+            Album.objects.update(files_dirty=True)
+            Song.objects.update(files_dirty=True)
+        sync_files()
+        delete_unused_covers()
         remove_empty_directories()
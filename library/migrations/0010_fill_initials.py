@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import datetime
+from south.db import db
+from south.v2 import DataMigration
+from django.db import models
+
+from django.conf import settings
+
+class Migration(DataMigration):
+
+    def forwards(self, orm):
+        "Set the initial of the existing artists and albums."
+        for model, field in [('Artist', 'name'), ('Album', 'title')]:
+            manager = orm['library.%s' % model].objects
+            pks = {}
+            for pk, name in manager.values_list('pk', field).iterator():
+                pks.setdefault(name[0].upper(), []).append(pk)
+            for initial, group in pks.items():
+                # Chunked to stay under the parameter limit of SQLite.
+                for i in range(0, len(group), 500):
+                    manager.filter(pk__in=group[i:i + 500]).update(
+                        initial=initial)
+
+    def backwards(self, orm):
+        "Nothing to do, the column is dropped by the previous migration."
+
+
+    models = {
+        'library.album': {
+            'Meta': {'ordering': "['title']", 'object_name': 'Album'},
+            'artist': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'albums'", 'to': "orm['library.Artist']"}),
+            'cover': ('django.db.models.fields.files.ImageField', [], {'max_length': '200'}),
+            'cover_file_type': ('django.db.models.fields.CharField', [], {'max_length': '5'}),
+            'filepath': ('django.db.models.fields.FilePathField', [], {'path': "'%s'" % settings.MEDIA_ROOT, 'unique': 'True', 'max_length': '200', 'recursive': 'True'}),
+            'files_dirty': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'initial': ('django.db.models.fields.CharField', [], {'max_length': '1', 'db_index': 'True'}),
+            'title': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        },
+        'library.artist': {
+            'Meta': {'ordering': "['name']", 'object_name': 'Artist'},
+            'filepath': ('django.db.models.fields.FilePathField', [], {'path': "'%s'" % settings.MEDIA_ROOT, 'unique': 'True', 'max_length': '200', 'recursive': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'initial': ('django.db.models.fields.CharField', [], {'max_length': '1', 'db_index': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '100'})
+        },
+        'library.dropboxentry': {
+            'Meta': {'object_name': 'DropboxEntry'},
+            'date_checked': ('django.db.models.fields.DateTimeField', [], {'auto_now': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'inode': ('django.db.models.fields.BigIntegerField', [], {}),
+            'mtime': ('django.db.models.fields.FloatField', [], {}),
+            'path': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '255'}),
+            'size': ('django.db.models.fields.BigIntegerField', [], {})
+        },
+        'library.importjob': {
+            'Meta': {'ordering': "['-date_created']", 'object_name': 'ImportJob'},
+            'date_created': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'date_finished': ('django.db.models.fields.DateTimeField', [], {'null': 'True'}),
+            'date_started': ('django.db.models.fields.DateTimeField', [], {'null': 'True'}),
+            'errors': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'files_done': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'files_total': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'message': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'status': ('django.db.models.fields.CharField', [], {'default': "'pending'", 'max_length': '10'})
+        },
+        'library.song': {
+            'Meta': {'ordering': "['track', 'title']", 'unique_together': "(('title', 'album', 'track'),)", 'object_name': 'Song'},
+            'album': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'songs'", 'to': "orm['library.Album']"}),
+            'bitrate': ('django.db.models.fields.IntegerField', [], {}),
+            'date_added': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'date_modified': ('django.db.models.fields.DateTimeField', [], {'auto_now': 'True', 'blank': 'True'}),
+            'filefield': ('django.db.models.fields.files.FileField', [], {'max_length': '200'}),
+            'files_dirty': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'filetype': ('django.db.models.fields.CharField', [], {'max_length': '10'}),
+            'first_save': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'original_path': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '200'}),
+            'title': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'track': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '10', 'blank': 'True'})
+        }
+    }
+
+    complete_apps = ['library']
+    symmetrical = True
@@ -1,10 +1,43 @@
+import hashlib
+import logging
 import os
+import tempfile
 
 from django.conf import settings
+from django.core.files import File
 from django.core.files.storage import FileSystemStorage
-from django.db import models, transaction, IntegrityError
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
+from . import archives
+from . import files
+from . import search
+from . import thumbnails
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class DropboxFile(File):
+    """File that is moved into place instead of being copied when saved
+    to a FileSystemStorage.
+
+    The storage renames the file when the destination is on the same file
+    system, and falls back to a chunked copy otherwise. Either way, the
+    original file is gone once saved.
+    """
+
+    def __init__(self, file, name=None):
+        super(DropboxFile, self).__init__(file, name)
+        # Django asks for the size after the save, once the file is moved.
+        self._size = os.path.getsize(file.name)
+
+    def temporary_file_path(self):
+        return self.file.name
+
 
 class CustomStorage(FileSystemStorage):
     """Custom FileSystemStorage class that overwrites existing files."""
@@ -12,14 +45,75 @@ class CustomStorage(FileSystemStorage):
     def _save(self, name, content):
         if self.exists(name):
             self.delete(name)
+
+        # A DropboxFile assigned to a file field reaches the storage wrapped
+        # in a FieldFile, which would be copied instead of moved.
+        if isinstance(getattr(content, 'file', None), DropboxFile):
+            content = content.file
+
         return super(CustomStorage, self)._save(name, content)
 
     def get_available_name(self, name):
         return name
 
 
+# Directory of the media folder in which the album covers are stored (see
+# `CoverStorage`).
+COVERS_DIR = '.covers'
+
+
+class CoverStorage(CustomStorage):
+    """Storage of the album covers, in which each distinct image is stored
+    once, under `COVERS_DIR` and a name made from the SHA-1 of its content
+    (like `.covers/ab/ab12[...].jpg`). Albums with the same cover share its
+    file, so it must only be deleted once no album uses it.
+    """
+
+    def _save(self, name, content):
+        digest = hashlib.sha1()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower() or '.jpg'
+        name = os.path.join(COVERS_DIR, digest[:2], digest + extension)
+        if self.exists(name):
+            return name
+
+        # The image is written under a temporary name, so that a concurrent
+        # save of the same image never sees a partially written file.
+        path = self.path(name)
+        directory = os.path.dirname(path)
+        if not os.path.exists(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                if not os.path.isdir(directory):
+                    raise
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    f.write(chunk)
+            if settings.FILE_UPLOAD_PERMISSIONS is not None:
+                os.chmod(tmp_path, settings.FILE_UPLOAD_PERMISSIONS)
+            os.rename(tmp_path, path)
+        except:
+            os.remove(tmp_path)
+            raise
+        return name
+
+    @staticmethod
+    def is_stored(name):
+        """Return whether the cover named `name` is in the store (instead
+        of being in the folder of its album, as they used to).
+        """
+        return name.startswith(COVERS_DIR + os.sep)
+
+
 class Artist(models.Model):
     name = models.CharField(_('name'), max_length=100, unique=True)
+    # Indexed along with the name (see `Meta.index_together`).
+    initial = models.CharField(_('initial'), max_length=1, editable=False)
     filepath = models.FilePathField(
         _('file path'),
         path=settings.MEDIA_ROOT,
@@ -29,6 +123,8 @@ class Artist(models.Model):
 
     class Meta:
         ordering = ['name']
+        # Matches the listing of the artists under an initial.
+        index_together = [('initial', 'name')]
         verbose_name = _('artist')
         verbose_name_plural = _('artists')
 
@@ -39,26 +135,40 @@ class Artist(models.Model):
     def get_absolute_url(self):
         return ('artist_detail', (), {'pk': str(self.pk)})
 
+    def build_filepath(self):
+        """Return the path of the artist folder in the media directory."""
+        return os.path.join(self.name[0].upper(), self.name)
+
+    def build_initial(self):
+        """Return the letter under which the artist is listed."""
+        return self.name[0].upper()
+
     # Overriden to take care of merging two artists.
     def save(self, *args, **kwargs):
         query = Artist.objects.filter(name=self.name).exclude(pk=self.pk)[:1]
         if query:
             # Artist with that name already exists. Merge the albums.
-
-            new_artist = query[0]
-
-            for album in self.albums.all():
-                # Used instead of bulk updating in order to update filepaths
-                # and resolve eventual merges of albums.
-                album.artist = new_artist
-                album.save()
-
             if self.pk:
-                self.delete()
+                merge_artists(self, query[0])
 
         else:
-            self.filepath = os.path.join(self.name[0].upper(), self.name)
-            super(Artist, self).save(*args, **kwargs)
+            old_filepath = self.filepath
+            self.filepath = self.build_filepath()
+            self.initial = self.build_initial()
+            if old_filepath and old_filepath != self.filepath:
+                # The albums are flagged along with the new path of the
+                # artist, so that `sync_files` moves their files if the
+                # directory below cannot be moved (or if the process dies
+                # before it is).
+                with transaction.commit_on_success():
+                    super(Artist, self).save(*args, **kwargs)
+                    self.albums.update(files_dirty=True)
+                # The paths of the albums and songs are updated along with
+                # the directory, so that the albums below have nothing to
+                # move (unless the directory could not be moved).
+                relocate_directory(old_filepath, self.filepath)
+            else:
+                super(Artist, self).save(*args, **kwargs)
 
             # This is needed to update album filepaths. We could avoid this
             # loop by making `filepath` an attribute of the Album model that is
@@ -73,8 +183,12 @@ class Artist(models.Model):
 
 class Album(models.Model):
     title = models.CharField(_('title'), max_length=100)
+    # Indexed along with the title, as is the artist (see
+    # `Meta.index_together`).
+    initial = models.CharField(_('initial'), max_length=1, editable=False)
     artist = models.ForeignKey(
-        Artist, verbose_name=_('artist'), related_name='albums')
+        Artist, verbose_name=_('artist'), related_name='albums',
+        db_index=False)
     filepath = models.FilePathField(
         _('file path'),
         path=settings.MEDIA_ROOT,
@@ -83,16 +197,23 @@ class Album(models.Model):
         unique=True)
     cover = models.ImageField(
         _('cover art'),
-        upload_to=(lambda a, f: a.cover_filepath),
+        upload_to=(lambda a, f: 'cover.%s' % a.cover_file_type),
         max_length=200,
-        storage=CustomStorage())
+        storage=CoverStorage())
 
     #TODO: validate on file upload, change to a choices field
     cover_file_type = models.CharField(
         _('cover file type'), max_length=5, editable=False)
 
+    # Set while the files of the album might not be at their place in the
+    # media directory, see `sync_files`.
+    files_dirty = models.BooleanField(default=False, editable=False)
+
     class Meta:
         ordering = ['title']
+        # Match the listing of the albums under an initial, and the lookup
+        # and listing of the albums of an artist.
+        index_together = [('initial', 'title'), ('artist', 'title')]
         verbose_name = _('album')
         verbose_name_plural = _('albums')
 
@@ -103,10 +224,13 @@ class Album(models.Model):
     def get_absolute_url(self):
         return ('album_detail', (), {'pk': str(self.pk)})
 
-    @property
-    def cover_filepath(self, filename=''):
-        """Return an appropriate file system path for the album cover."""
-        return os.path.join(self.filepath, 'cover.%s' % self.cover_file_type)
+    def build_filepath(self):
+        """Return the path of the album folder in the media directory."""
+        return os.path.join(self.artist.filepath, self.title)
+
+    def build_initial(self):
+        """Return the letter under which the album is listed."""
+        return self.title[0].upper()
 
     # Overriden to take care of merging two albums.
     def save(self, *args, **kwargs):
@@ -118,41 +242,75 @@ class Album(models.Model):
                                 ).exclude(pk=self.pk)[:1]
             if query:
                 # Album with that name already exists. Merge the songs.
-
-                new_album = query[0]
-
-                with transaction.commit_manually():
-                    try:
-                        self.songs.update(album=new_album)
-                        transaction.commit()
-                    except IntegrityError:
-                        # At least one of the song already exists under the other
-                        # album. We want to ignore these, and so we must save each
-                        # song one by one in order to catch the IntegrityError.
-
-                        transaction.rollback()
-
-                        for song in self.songs.all():
-                            song.album = new_album
-                            try:
-                                song.save()
-                            except IntegrityError:
-                                transaction.rollback()
-                            else:
-                                transaction.commit()
-
                 if self.pk:
-                    self.delete()
-
+                    merge_albums(self, query[0])
                 return
 
-        self.filepath = os.path.join(self.artist.filepath, self.title)
+        old_filepath = self.filepath
+        self.filepath = self.build_filepath()
+        self.initial = self.build_initial()
+        unstored_cover = self.cover and not CoverStorage.is_stored(
+            self.cover.name)
+        if self.pk and (self.filepath != old_filepath or unstored_cover):
+            self.files_dirty = True
         super(Album, self).save(*args, **kwargs)
+        if self.files_dirty:
+            self.sync_files()
+
+    def sync_files(self):
+        """Move the song files of the album to their place in the media
+        directory, put a cover still kept in the folder of the album in the
+        cover store, and clear the dirty flag of the album.
+
+        If all the files of the album are in another directory, the whole
+        directory is moved.
+        """
+        # The path is rebuilt, since the artist might have been renamed
+        # since it was saved.
+        self.filepath = self.build_filepath()
+        unstored_cover = self.cover and not CoverStorage.is_stored(
+            self.cover.name)
+        names = [self.cover.name] if unstored_cover else []
+        names += self.songs.values_list('filefield', flat=True)
+        directories = set(os.path.dirname(name) for name in names if name)
+        if len(directories) == 1:
+            old_filepath = directories.pop()
+            if (old_filepath != self.filepath and
+                    relocate_directory(old_filepath, self.filepath)):
+                self.cover.name = files.replace_prefix(
+                    self.cover.name, old_filepath, self.filepath)
+
+        if unstored_cover:
+            self._store_cover()
+        for song in self.songs.all():
+            song.album = self
+            if song.files_dirty or song.filefield.name != song.filepath:
+                song.sync_files()
+        self.files_dirty = False
+        Album.objects.filter(pk=self.pk).update(
+            filepath=self.filepath, cover=self.cover.name, files_dirty=False)
+
+    def _store_cover(self):
+        """Put the cover of the album in the cover store, and delete it from
+        the folder of the album.
+        """
+        storage = self.cover.storage
+        old_name = self.cover.name
+        if not storage.exists(old_name):
+            LOGGER.error('Cannot store missing cover "%s"' % old_name)
+            return
+        with storage.open(old_name) as f:
+            self.cover.save(old_name, File(f), save=False)
+        thumbnails.delete_thumbnails(storage, old_name)
+        storage.delete(old_name)
+        files.remove_empty_parents(storage, old_name)
 
 
 class Song(models.Model):
     title = models.CharField(_('title'), max_length=100)
-    album = models.ForeignKey(Album, verbose_name=_('album'), related_name='songs')
+    # Indexed along with the track and title (see `Meta.index_together`).
+    album = models.ForeignKey(
+        Album, verbose_name=_('album'), related_name='songs', db_index=False)
     track = models.CharField(_('track'), max_length=10, default='', blank=True)
     bitrate = models.IntegerField(_('bitrate'))
     filetype = models.CharField(_('file type'), max_length=10)
@@ -163,14 +321,22 @@ class Song(models.Model):
         storage=CustomStorage())
     original_path = models.CharField(
         _('original path'), max_length=200, default='')
-    date_added = models.DateTimeField(_('date added'), auto_now_add=True)
+    date_added = models.DateTimeField(
+        _('date added'), auto_now_add=True, db_index=True)
     date_modified = models.DateTimeField(
         _('date last modified'), auto_now=True)
     first_save = models.BooleanField(editable=False)
 
+    # Set while the file of the song might not be at its place in the media
+    # directory, see `sync_files`.
+    files_dirty = models.BooleanField(default=False, editable=False)
+
     class Meta:
         ordering = ['track', 'title']
         unique_together = ('title', 'album', 'track')
+        # Match the listing of the songs of an album, and of the whole
+        # library (see `views.SongListView`).
+        index_together = [('album', 'track', 'title'), ('track', 'title')]
         verbose_name = _('song')
         verbose_name_plural = _('songs')
 
@@ -191,4 +357,290 @@ class Song(models.Model):
     def save(self, *args, **kwargs):
         if len(self.track) == 1:
             self.track = '0' + self.track
+        # A new file is stored at the right place when the song is saved.
+        if (self.pk and self.filefield and self.filefield._committed and
+                self.filefield.name != self.filepath):
+            self.files_dirty = True
         super(Song, self).save(*args, **kwargs)
+        if self.files_dirty:
+            self.sync_files()
+
+    def sync_files(self):
+        """Move the file of the song to its place in the media directory,
+        and clear the dirty flag of the song.
+        """
+        # The path of the album is rebuilt, since its artist might have been
+        # renamed since it was saved.
+        self.album.filepath = self.album.build_filepath()
+        if self.filefield:
+            files.move_file(self.filefield, self.filepath)
+        self.files_dirty = False
+        Song.objects.filter(pk=self.pk).update(
+            filefield=self.filefield.name, files_dirty=False)
+
+
+# Fields holding paths relative to the media directory.
+PATH_FIELDS = [
+    (Artist, 'filepath'),
+    (Album, 'filepath'),
+    (Album, 'cover'),
+    (Song, 'filefield'),
+]
+
+
+def merge_artists(source, target):
+    """Move the albums of the artist `source` to `target`, merging the
+    albums they have in common (see `merge_albums`), and delete `source`.
+    Returns the list of songs that could not be merged.
+
+    The database is updated in a single transaction, and the files are only
+    moved once it is committed.
+    """
+
+    target_albums = dict(target.albums.values_list('title', 'pk'))
+    moved_albums = []
+    merged_albums = []
+    conflicts = []
+
+    with transaction.commit_on_success():
+        for album in source.albums.all():
+            if album.title in target_albums:
+                target_pk = target_albums[album.title]
+                conflicts += _merge_songs(album, target_pk)
+                merged_albums.append((album, target_pk))
+            else:
+                album.artist = target
+                Album.objects.filter(pk=album.pk).update(
+                    artist=target, filepath=album.build_filepath(),
+                    files_dirty=True)
+                moved_albums.append(album.pk)
+        source.delete()
+
+    for album, target_pk in merged_albums:
+        _delete_merged_cover(album)
+    affected = moved_albums + [pk for album, pk in merged_albums]
+    for album in Album.objects.filter(pk__in=affected).select_related():
+        album.sync_files()
+        archives.invalidate('album', album.pk)
+    archives.invalidate('artist', target.pk)
+    search.enqueue_update(Artist, [target.pk], contents=True)
+
+    _report_conflicts(conflicts)
+    return conflicts
+
+
+def merge_albums(source, target):
+    """Move the songs of the album `source` to `target` and delete `source`.
+    Returns the list of songs that could not be merged, because `target`
+    already had a song with the same title and track. These songs are
+    deleted, but their files are left in place.
+
+    The database is updated in a single transaction, and the files are only
+    moved once it is committed.
+    """
+
+    with transaction.commit_on_success():
+        conflicts = _merge_songs(source, target.pk)
+        source.delete()
+
+    _delete_merged_cover(source)
+    target = Album.objects.select_related().get(pk=target.pk)
+    target.sync_files()
+    archives.invalidate('album', target.pk)
+    archives.invalidate('artist', target.artist_id)
+    search.enqueue_update(Album, [target.pk], contents=True)
+
+    _report_conflicts(conflicts)
+    return conflicts
+
+
+# Condition matching the songs that have the same title and track as a song
+# of the album whose primary key is given as parameter.
+_CONFLICTING_SONG_SQL = '''EXISTS (
+    SELECT 1 FROM %(table)s AS other
+    WHERE other.album_id = %%s
+    AND other.title = %(table)s.title
+    AND other.track = %(table)s.track)'''
+
+
+def _merge_songs(source, target_pk):
+    """Move the songs of the album `source` to the album with primary key
+    `target_pk`, except those conflicting with one of its songs, which are
+    returned.
+    """
+
+    songs = Song.objects.filter(album=source)
+    conflicts = list(songs.extra(
+        where=[_CONFLICTING_SONG_SQL % {'table': Song._meta.db_table}],
+        params=[target_pk]))
+    songs.exclude(pk__in=[song.pk for song in conflicts]).update(
+        album=target_pk, files_dirty=True)
+    return conflicts
+
+
+def _delete_merged_cover(album):
+    if album.cover:
+        delete_cover(album.cover.storage, album.cover.name)
+
+
+def delete_cover(storage, name):
+    """Delete the cover named `name` from `storage`, with its thumbnails,
+    unless an album still uses it.
+    """
+    if Album.objects.filter(cover=name).exists():
+        return
+    thumbnails.delete_thumbnails(storage, name)
+    if storage.exists(name):
+        storage.delete(name)
+    files.remove_empty_parents(storage, name)
+
+
+def _report_conflicts(conflicts):
+    for song in conflicts:
+        LOGGER.warning(
+            'Song "%s" was not merged since it already exists in the album, '
+            'its file is left at "%s"' % (song.title, song.filefield.name))
+
+
+def relocate_directory(old_filepath, new_filepath):
+    """Rename the directory `old_filepath` of the media directory to
+    `new_filepath`, and update the paths of the artists, albums and songs it
+    contains. Returns False if the directory could not be moved.
+    """
+    storage = Song._meta.get_field('filefield').storage
+    return files.move_directory(
+        storage, old_filepath, new_filepath, _update_paths)
+
+
+def recover_relocations():
+    """Complete or roll back the directory moves that were interrupted."""
+    storage = Song._meta.get_field('filefield').storage
+    files.recover(storage, _update_paths)
+
+
+def _update_paths(old_filepath, new_filepath):
+    with transaction.commit_on_success():
+        for model, field in PATH_FIELDS:
+            rows = model.objects.filter(
+                models.Q(**{field: old_filepath}) |
+                models.Q(**{field + '__startswith': old_filepath + os.sep}))
+            for pk, path in rows.values_list('pk', field):
+                path = files.replace_prefix(path, old_filepath, new_filepath)
+                model.objects.filter(pk=pk).update(**{field: path})
+
+
+# Cached archives are deleted as soon as their content might have changed.
+
+@receiver(post_save, sender=Artist)
+@receiver(post_delete, sender=Artist)
+def invalidate_artist_archives(sender, instance, **kwargs):
+    archives.invalidate('artist', instance.pk)
+
+
+@receiver(post_save, sender=Album)
+@receiver(post_delete, sender=Album)
+def invalidate_album_archives(sender, instance, **kwargs):
+    archives.invalidate('album', instance.pk)
+    archives.invalidate('artist', instance.artist_id)
+
+
+@receiver(post_save, sender=Song)
+@receiver(post_delete, sender=Song)
+def invalidate_song_archives(sender, instance, **kwargs):
+    # The archive of the artist is not deleted here, as this would require
+    # fetching the album. It will not be served anymore since its songs'
+    # fingerprint changed, and will eventually be pruned.
+    archives.invalidate('album', instance.album_id)
+
+
+class DropboxEntry(models.Model):
+    """A file of the dropbox that could not be imported into the library.
+
+    The size, modification time and inode of the file are recorded so that
+    it is not read again by subsequent updates unless it is modified.
+    """
+
+    path = models.TextField(_('path'))
+    # The paths can be longer than what a unique index of some databases
+    # allows, so their uniqueness is enforced on a digest instead.
+    path_hash = models.CharField(_('path hash'), max_length=40, unique=True)
+    size = models.BigIntegerField(_('size'))
+    mtime = models.FloatField(_('modification time'))
+    inode = models.BigIntegerField(_('inode'))
+    date_checked = models.DateTimeField(_('date checked'), auto_now=True)
+
+    class Meta:
+        verbose_name = _('dropbox entry')
+        verbose_name_plural = _('dropbox entries')
+
+    def __init__(self, *args, **kwargs):
+        super(DropboxEntry, self).__init__(*args, **kwargs)
+        if self.path and not self.path_hash:
+            self.path_hash = self.hash_path(self.path)
+
+    def __unicode__(self):
+        return self.path
+
+    @staticmethod
+    def hash_path(path):
+        """Return the digest of `path` held by the `path_hash` field."""
+        return hashlib.sha1(path.encode('utf-8')).hexdigest()
+
+    def matches(self, stat):
+        """Return True if the file described by the `os.stat` result
+        `stat` has not changed since the entry was recorded.
+        """
+        return (self.size == stat.st_size and
+                self.inode == stat.st_ino and
+                abs(self.mtime - stat.st_mtime) < 1e-3)
+
+
+class ImportJob(models.Model):
+    """A library update, run in the background by the `importworker`
+    management command.
+    """
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, _('pending')),
+        (RUNNING, _('running')),
+        (DONE, _('done')),
+        (FAILED, _('failed')),
+    )
+
+    status = models.CharField(
+        _('status'), max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    date_created = models.DateTimeField(_('date created'), auto_now_add=True)
+    date_started = models.DateTimeField(_('date started'), null=True)
+    date_finished = models.DateTimeField(_('date finished'), null=True)
+    files_total = models.IntegerField(_('files to process'), default=0)
+    files_done = models.IntegerField(_('files processed'), default=0)
+    errors = models.IntegerField(_('errors'), default=0)
+    message = models.TextField(_('message'), blank=True)
+
+    # Worker running the job (as `host:pid`), and last time it recorded that
+    # it was still alive (see `jobs.Heartbeat`).
+    worker = models.CharField(_('worker'), max_length=100, blank=True)
+    date_heartbeat = models.DateTimeField(_('date of heartbeat'), null=True)
+
+    class Meta:
+        ordering = ['-date_created']
+        verbose_name = _('import job')
+        verbose_name_plural = _('import jobs')
+
+    def __unicode__(self):
+        return u'%s (%s)' % (self.date_created, self.status)
+
+    @property
+    def rate(self):
+        """Number of files processed per second."""
+        if not self.date_started:
+            return 0.0
+        end = self.date_finished or timezone.now()
+        elapsed = (end - self.date_started).total_seconds()
+        if not elapsed:
+            return 0.0
+        return self.files_done / elapsed
@@ -0,0 +1,70 @@
+"""Keyset pagination of querysets.
+
+Instead of skipping the rows of the previous pages with an offset, a page is
+fetched by filtering on the sort key of the last row of the previous page
+(given by an opaque cursor), so that fetching any page costs the same.
+"""
+
+import base64
+import json
+
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPaginator(object):
+    """Paginate `queryset` by pages of `per_page` objects, sorted by the
+    fields in `ordering` (which may be prefixed with '-' for descending
+    order). The primary key is used to break ties.
+    """
+
+    def __init__(self, queryset, ordering, per_page):
+        self.fields = [f.lstrip('-') for f in ordering] + ['pk']
+        self.descending = [f.startswith('-') for f in ordering] + [False]
+        self.queryset = queryset.order_by(*(list(ordering) + ['pk']))
+        self.per_page = per_page
+
+    def page(self, cursor=None):
+        """Return the list of objects of the page following the one that
+        `cursor` was returned with (the first page if `cursor` is None), and
+        the cursor of the next page (None if this is the last page).
+        """
+        queryset = self.queryset
+        if cursor is not None:
+            queryset = queryset.filter(self._after(self._decode(cursor)))
+        objects = list(queryset[:self.per_page + 1])
+
+        next_cursor = None
+        if len(objects) > self.per_page:
+            objects = objects[:self.per_page]
+            next_cursor = self._encode(objects[-1])
+        return objects, next_cursor
+
+    def _after(self, values):
+        """Return the condition matching the objects sorted after the object
+        whose sort key is `values`.
+        """
+        condition = Q()
+        for i, field in enumerate(self.fields):
+            lookup = '__lt' if self.descending[i] else '__gt'
+            term = Q(**{field + lookup: values[i]})
+            for other, value in zip(self.fields[:i], values[:i]):
+                term &= Q(**{other: value})
+            condition |= term
+        return condition
+
+    def _encode(self, obj):
+        values = [getattr(obj, field) for field in self.fields]
+        return base64.urlsafe_b64encode(json.dumps(values))
+
+    def _decode(self, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(str(cursor)))
+        except (TypeError, ValueError, UnicodeEncodeError):
+            raise InvalidCursor(cursor)
+        if not isinstance(values, list) or len(values) != len(self.fields):
+            raise InvalidCursor(cursor)
+        return values
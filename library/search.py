@@ -0,0 +1,237 @@
+"""Updates of the search index, buffered and written in batches.
+
+Saving or deleting an artist, album or song does not write to the search
+index right away. The change is added to a buffer instead, which is flushed
+every `SEARCH_INDEX_FLUSH_INTERVAL` seconds by a background thread, or as
+soon as it holds `SEARCH_INDEX_BUFFER_SIZE` changes. All the documents of a
+model that changed in the meantime are then written with a single commit to
+the index, which is much faster than one commit per document while
+importing a whole library. The changes that could not be written are kept
+in the buffer and retried by the next flush.
+
+The changes are added to the buffer by the signal processor of Haystack
+(see `signals.BufferedSignalProcessor`). Changes made without sending
+signals (like `bulk_create` or `update`) have to be added to the buffer
+explicitly, with `enqueue_update`.
+"""
+
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class IndexBuffer(object):
+    """Thread-safe buffer of the changes to write to the search index.
+
+    The buffer is flushed by a background thread `interval` seconds after
+    the first change added to it, and by the thread adding a change when it
+    holds `size` changes, so that it never grows unbounded.
+    """
+
+    def __init__(self, size, interval):
+        self.size = size
+        self.interval = interval
+        # Map `(model, pk)` to True if the instance is to be updated, or
+        # False if it is to be removed from the index.
+        self._changes = {}
+        # Instances whose artist, albums or songs are to be updated, as
+        # their documents include data of the instance.
+        self._containers = set()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+
+    def update(self, model, pks, contents=False):
+        """Add the instances of `model` with primary keys `pks` to the
+        instances to update. If `contents` is True, the albums and songs
+        they contain are updated as well.
+        """
+        self._add(model, pks, True, contents)
+
+    def remove(self, model, pks):
+        """Add the instances of `model` with primary keys `pks` to the
+        instances to remove from the index.
+        """
+        self._add(model, pks, False, False)
+
+    def _add(self, model, pks, update, contents):
+        with self._lock:
+            for pk in pks:
+                self._changes[(model, pk)] = update
+                if contents:
+                    self._containers.add((model, pk))
+            full = len(self._changes) + len(self._containers) >= self.size
+            if not full:
+                self._start_timer()
+        if full:
+            self.flush()
+
+    def _start_timer(self):
+        # Called with `_lock` held.
+        if self._timer is None:
+            self._timer = threading.Timer(self.interval, self._run_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Write the buffered changes to the search index."""
+        # Flushes are serialized, so that the changes of an instance are
+        # written in the order in which they were made.
+        with self._flush_lock:
+            with self._lock:
+                changes, self._changes = self._changes, {}
+                containers, self._containers = self._containers, set()
+            if changes or containers:
+                try:
+                    _write(changes, containers)
+                except Exception:
+                    LOGGER.exception(
+                        'Could not update the search index with %d changes'
+                        ', they will be retried' % len(changes))
+                    self._restore(changes, containers)
+
+    def _restore(self, changes, containers):
+        """Put back into the buffer the changes that could not be written,
+        so that they are retried by the next flush. The changes made to the
+        same instances in the meantime are kept instead.
+        """
+        with self._lock:
+            for key, update in changes.items():
+                self._changes.setdefault(key, update)
+            self._containers.update(containers)
+            self._start_timer()
+
+    def close(self):
+        """Stop the background thread and write the buffered changes."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        self.flush()
+
+    def _run_timer(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        finally:
+            # Do not keep a database connection open in this thread.
+            connection.close()
+
+
+def _write(changes, containers):
+    # Haystack is not imported at the top of the module, since it loads the
+    # signal processor (see `signals`) that uses this module.
+    from haystack import connections, connection_router
+    from .models import Artist, Album, Song
+
+    updated = {}
+    removed = {}
+    for (model, pk), update in changes.items():
+        if update:
+            updated.setdefault(model, set()).add(pk)
+        else:
+            removed.setdefault(model, []).append(pk)
+
+    artists = [pk for model, pk in containers if model is Artist]
+    albums = [pk for model, pk in containers if model is Album]
+    if artists:
+        updated.setdefault(Album, set()).update(Album.objects.filter(
+            artist__in=artists).values_list('pk', flat=True))
+        updated.setdefault(Song, set()).update(Song.objects.filter(
+            album__artist__in=artists).values_list('pk', flat=True))
+    if albums:
+        updated.setdefault(Song, set()).update(Song.objects.filter(
+            album__in=albums).values_list('pk', flat=True))
+
+    for using in connection_router.for_write():
+        backend = connections[using].get_backend()
+        unified_index = connections[using].get_unified_index()
+        for model, pks in updated.items():
+            index = unified_index.get_index(model)
+            queryset = index.index_queryset(using=using)
+            pks = list(pks)
+            size = settings.SEARCH_INDEX_BUFFER_SIZE
+            for start in range(0, len(pks), size):
+                # The instances are fetched before the index is opened for
+                # writing, which would stay locked if the query failed (and
+                # which the Whoosh backend leaves locked when given no
+                # instance). Instances deleted since they were saved are
+                # skipped.
+                objects = list(queryset.filter(pk__in=pks[start:start + size]))
+                if objects:
+                    backend.update(index, objects)
+        for model, pks in removed.items():
+            _remove(backend, [_identifier(model, pk) for pk in pks])
+
+
+def _remove(backend, identifiers):
+    """Remove the documents with the given identifiers from the index of
+    `backend`. The `remove` method of the backends commits once per
+    document, so the documents are deleted with a single Whoosh writer
+    instead.
+    """
+    from haystack.constants import ID
+    try:
+        from haystack.backends.whoosh_backend import WhooshSearchBackend
+        from whoosh.writing import AsyncWriter
+    except ImportError:
+        WhooshSearchBackend = None
+
+    if WhooshSearchBackend is None or not isinstance(
+            backend, WhooshSearchBackend):
+        for identifier in identifiers:
+            backend.remove(identifier)
+        return
+
+    if not backend.setup_complete:
+        backend.setup()
+    backend.index = backend.index.refresh()
+    writer = AsyncWriter(backend.index)
+    try:
+        for identifier in identifiers:
+            writer.delete_by_term(ID, identifier)
+    except Exception:
+        writer.cancel()
+        raise
+    writer.commit()
+
+
+def _identifier(model, pk):
+    return '%s.%s.%s' % (model._meta.app_label, model._meta.module_name, pk)
+
+
+def enqueue_update(model, pks, contents=False):
+    """Schedule the update in the search index of the instances of `model`
+    with primary keys `pks` (see `IndexBuffer.update`).
+    """
+    get_buffer().update(model, pks, contents=contents)
+
+
+def flush():
+    """Write the pending changes to the search index right away."""
+    get_buffer().flush()
+
+
+_buffer = None
+_lock = threading.Lock()
+
+
+def get_buffer():
+    """Return the buffer of changes to the search index, which is flushed
+    when the process exits.
+    """
+    global _buffer
+    with _lock:
+        if _buffer is None:
+            _buffer = IndexBuffer(
+                settings.SEARCH_INDEX_BUFFER_SIZE,
+                settings.SEARCH_INDEX_FLUSH_INTERVAL)
+            atexit.register(_buffer.close)
+    return _buffer
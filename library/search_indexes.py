@@ -1,10 +1,11 @@
-from haystack.indexes import CharField, Indexable, SearchIndex
+from haystack.indexes import CharField, EdgeNgramField, Indexable, SearchIndex
 
 from .models import Artist, Album, Song
 
 
 class ArtistIndex(SearchIndex, Indexable):
     text = CharField(document=True, use_template=True)
+    autocomplete = EdgeNgramField(model_attr='name')
 
     def get_model(self):
         return Artist
@@ -12,16 +13,24 @@ class ArtistIndex(SearchIndex, Indexable):
 
 class AlbumIndex(SearchIndex, Indexable):
     text = CharField(document=True, use_template=True)
+    autocomplete = EdgeNgramField(model_attr='title')
     artist = CharField(model_attr='artist')
 
     def get_model(self):
         return Album
 
+    def index_queryset(self, using=None):
+        return self.get_model().objects.select_related('artist')
+
 
 class SongIndex(SearchIndex, Indexable):
     text = CharField(document=True, use_template=True)
+    autocomplete = EdgeNgramField(model_attr='title')
     artist = CharField(model_attr='album__artist')
     album = CharField(model_attr='album')
 
     def get_model(self):
         return Song
+
+    def index_queryset(self, using=None):
+        return self.get_model().objects.select_related('album__artist')
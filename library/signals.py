@@ -0,0 +1,31 @@
+from haystack.signals import BaseSignalProcessor
+
+from django.db.models import signals
+
+from . import search
+from .models import Artist, Album, Song
+
+
+class BufferedSignalProcessor(BaseSignalProcessor):
+    """Signal processor adding the saved and deleted artists, albums and
+    songs to the buffer of changes of the search index.
+    """
+
+    def setup(self):
+        for model in (Artist, Album, Song):
+            signals.post_save.connect(self.handle_save, sender=model)
+            signals.post_delete.connect(self.handle_delete, sender=model)
+
+    def teardown(self):
+        for model in (Artist, Album, Song):
+            signals.post_save.disconnect(self.handle_save, sender=model)
+            signals.post_delete.disconnect(self.handle_delete, sender=model)
+
+    def handle_save(self, sender, instance, **kwargs):
+        # The albums and songs of an artist or album that already existed
+        # might have to be updated, since it might have been renamed.
+        contents = not kwargs.get('created')
+        search.enqueue_update(sender, [instance.pk], contents=contents)
+
+    def handle_delete(self, sender, instance, **kwargs):
+        search.get_buffer().remove(sender, [instance.pk])
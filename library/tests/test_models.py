@@ -7,7 +7,9 @@ from django.db import IntegrityError
 from django.test import TransactionTestCase
 from django.test.utils import override_settings
 
-from ..models import Artist, Album, Song, CustomStorage
+from ..models import (
+    Artist, Album, Song, CoverStorage, CustomStorage, merge_albums,
+    merge_artists)
 from ..utils import full_path
 
 
@@ -42,7 +44,7 @@ class ModelTest(TransactionTestCase):
         self._default_storage = self._songfield.storage
         self._songfield.storage = test_storage
         self._albumfield = Album._meta.get_field_by_name('cover')[0]
-        self._albumfield.storage = test_storage
+        self._albumfield.storage = CoverStorage(location=self.media_dir)
 
     def tearDown(self):
         os.remove(self.media_file.name)
@@ -144,6 +146,22 @@ class ArtistModelTest(ModelTest):
             common_album.songs.values_list('title', flat=True),
             ['Common Song 1', 'Common Song 2', 'Common Song 3'])
 
+    def test_merge_artists_reports_conflicts(self):
+        artist1 = Artist.objects.get(name='First Artist')
+        artist2 = Artist.objects.get(name='Other Artist')
+
+        conflicts = merge_artists(artist1, artist2)
+
+        self.assertEqual([song.title for song in conflicts], ['Common Song 3'])
+        self.assertEqual(
+            Song.objects.filter(title='Common Song 3').count(), 1)
+        for song in Song.objects.all():
+            self.assertEqual(song.album.artist, artist2)
+            self.assertEqual(song.filefield.name, song.filepath)
+            self.assertTrue(os.path.exists(full_path(song.filepath)))
+        for album in artist2.albums.all():
+            self.assertTrue(os.path.exists(full_path(album.cover.name)))
+
     def test_save_artist_without_change_is_idempotent(self):
         artist = Artist.objects.get(name='First Artist')
         self.assertEqual(artist.name, 'First Artist')
@@ -217,6 +235,22 @@ class AlbumModelTest(ModelTest):
             album2.songs.values_list('title', flat=True),
             ['The First Song', 'Second Song'])
 
+    def test_merge_albums_moves_song_files(self):
+        album1 = Album.objects.get(title='First Album')
+        album2 = Album.objects.get(title='Second Album')
+
+        conflicts = merge_albums(album1, album2)
+
+        self.assertEqual(conflicts, [])
+        song = album2.songs.get(title='The First Song')
+        self.assertEqual(song.filefield.name, song.filepath)
+        self.assertEqual(song.album, album2)
+        self.assertTrue(os.path.exists(full_path(song.filefield.name)))
+        self.assertFalse(
+            os.path.exists(full_path('T/The Artist/First Album')))
+        # The cover is shared by both albums, and is thus kept
+        self.assertTrue(os.path.exists(full_path(album2.cover.name)))
+
     def test_omitting_skip_merge_check_raises_integrity_error(self):
         album = Album.objects.get(title='First Album')
         album.title = 'Second Album'
@@ -231,7 +265,7 @@ class AlbumModelTest(ModelTest):
         self.assertTrue(os.path.exists(full_path(album.filepath)))
         self.assertItemsEqual(
             os.listdir(full_path(album.filepath)),
-            ['cover.jpg', 'The First Song.ogg'])
+            ['The First Song.ogg'])
 
         album.save()
 
@@ -241,7 +275,7 @@ class AlbumModelTest(ModelTest):
         self.assertTrue(os.path.exists(full_path(album.filepath)))
         self.assertItemsEqual(
             os.listdir(full_path(album.filepath)),
-            ['cover.jpg', 'The First Song.ogg'])
+            ['The First Song.ogg'])
 
 
 @override_settings(MEDIA_ROOT=TEST_MEDIA_DIR)
@@ -264,7 +298,7 @@ class SongModelTest(ModelTest):
         filename = os.path.join(
             self.media_dir, 'T', 'The Artist', 'The Album', 'The Song.ogg')
 
-        self.assertEqual(os.listdir(self.media_dir), ['T'])
+        self.assertItemsEqual(os.listdir(self.media_dir), ['.covers', 'T'])
         self.assertTrue(os.path.exists(filename))
         self.assertEqual(
             open(self.media_file.name).read(), open(filename).read())
@@ -7,14 +7,15 @@ import shutil
 import tempfile
 import zipfile
 
+from django.core.files.base import ContentFile
 from django.test import TransactionTestCase
 from django.test.utils import override_settings
 
-from ..models import Artist, Album, Song, CustomStorage
-from .. import update
+from ..models import Artist, Album, Song, CoverStorage, CustomStorage
+from .. import files, thumbnails, update, zipstream
 from ..utils import (
-    delete_empty_instances, full_path, remove_empty_directories,
-    sync_song_files, sync_cover_images, titlecase
+    delete_empty_instances, delete_unused_covers, full_path,
+    remove_empty_directories, sync_files, titlecase, zip_folder
 )
 
 
@@ -42,7 +43,7 @@ class UtilsTest(TransactionTestCase):
         self._default_storage = self._songfield.storage
         self._songfield.storage = test_storage
         self._albumfield = Album._meta.get_field_by_name('cover')[0]
-        self._albumfield.storage = test_storage
+        self._albumfield.storage = CoverStorage(location=TEST_MEDIA_DIR)
 
         # Upload some songs to the library
         zipped_dropbox = os.path.join(TEST_FILES_DIR, 'test_dropbox.zip')
@@ -59,7 +60,7 @@ class UtilsTest(TransactionTestCase):
         """Asserts that nothing was written to the log file."""
         self.assertEqual(os.path.getsize(self.logfile.name), 0)
 
-    def test_sync_song_files(self):
+    def test_song_file_moved_on_save(self):
         song = Song.objects.get(pk=1)
         original_filepath = song.filepath
         self.assertEqual(
@@ -69,79 +70,173 @@ class UtilsTest(TransactionTestCase):
         song.title = 'Spam'
         song.save()
 
+        song = Song.objects.get(pk=1)
         self.assertEqual(song.filepath, 'T/The Artist/The Album/04 - Spam.ogg')
-        self.assertTrue(os.path.exists(full_path(original_filepath)))
-        self.assertFalse(os.path.exists(full_path(song.filepath)))
-
-        sync_song_files()
-
+        self.assertEqual(song.filefield.name, song.filepath)
+        self.assertFalse(song.files_dirty)
         self.assertFalse(os.path.exists(full_path(original_filepath)))
         self.assertTrue(os.path.exists(full_path(song.filepath)))
 
-    def test_sync_cover_images(self):
+    def test_cover_kept_in_store_on_save(self):
         album = Album.objects.get(pk=1)
-        original_coverpath = album.cover_filepath
-        self.assertEqual(
-            album.cover_filepath, 'T/The Artist/The Album/cover.jpg')
-        self.assertTrue(os.path.exists(full_path(album.cover_filepath)))
+        cover_name = album.cover.name
+        self.assertTrue(cover_name.startswith('.covers/'))
+        self.assertTrue(os.path.exists(full_path(cover_name)))
 
         album.title = 'Egg'
         album.save()
 
-        self.assertEqual(album.cover_filepath, 'T/The Artist/Egg/cover.jpg')
-        self.assertTrue(os.path.exists(full_path(original_coverpath)))
-        self.assertFalse(os.path.exists(full_path(album.cover_filepath)))
+        album = Album.objects.get(pk=1)
+        self.assertEqual(album.cover.name, cover_name)
+        self.assertFalse(album.files_dirty)
+        self.assertTrue(os.path.exists(full_path(cover_name)))
+        for song in album.songs.all():
+            self.assertTrue(os.path.exists(full_path(song.filepath)))
+
+    def test_identical_covers_are_stored_once(self):
+        # The albums of the test files all have the default cover
+        covers = set(Album.objects.values_list('cover', flat=True))
+        self.assertEqual(len(covers), 1)
+        self.assertEqual(
+            len(os.listdir(os.path.dirname(full_path(covers.pop())))), 1)
+
+    def test_sync_files_stores_cover_of_album_folder(self):
+        album = Album.objects.get(pk=1)
+        stored_name = album.cover.name
+        old_name = os.path.join(album.filepath, 'cover.jpg')
+        shutil.copy(full_path(stored_name), full_path(old_name))
+        Album.objects.filter(pk=1).update(cover=old_name, files_dirty=True)
+
+        sync_files()
+
+        album = Album.objects.get(pk=1)
+        self.assertEqual(album.cover.name, stored_name)
+        self.assertFalse(os.path.exists(full_path(old_name)))
+
+    def test_delete_unused_covers(self):
+        album = Album.objects.get(pk=1)
+        album.cover.save('cover.png', ContentFile(b'unused'), save=False)
+        unused_name = album.cover.name
+        thumbnail = thumbnails.thumbnail_name(unused_name, 150)
+        with open(full_path(thumbnail), 'wb') as f:
+            f.write(b'thumbnail')
+        used_names = set(Album.objects.values_list('cover', flat=True))
 
-        sync_cover_images()
+        delete_unused_covers()
 
-        self.assertFalse(os.path.exists(full_path(original_coverpath)))
-        self.assertTrue(os.path.exists(full_path(album.cover_filepath)))
+        self.assertFalse(os.path.exists(full_path(unused_name)))
+        self.assertFalse(os.path.exists(full_path(thumbnail)))
+        for name in used_names:
+            self.assertTrue(os.path.exists(full_path(name)))
 
-    def test_sync_songs_and_cover(self):
+    def test_songs_and_cover_moved_on_artist_rename(self):
         artist = Artist.objects.get(pk=1)
         original_path = artist.filepath
         self.assertEqual(artist.filepath, 'T/The Artist')
         self.assertTrue(os.path.exists(full_path(artist.filepath)))
-        self.assertTrue(
-            os.path.exists(
-                os.path.join(
-                    full_path(artist.filepath), 'The Album', 'cover.jpg')))
 
         artist.name = 'Brian'
         artist.save()
 
         self.assertEqual(artist.filepath, 'B/Brian')
-        self.assertTrue(os.path.exists(full_path(original_path)))
-        self.assertFalse(os.path.exists(full_path(artist.filepath)))
-        self.assertTrue(
-            os.path.exists(
-                os.path.join(
-                    full_path(original_path), 'The Album', 'cover.jpg')))
+        self.assertFalse(os.path.exists(full_path(original_path)))
+        for album in artist.albums.all():
+            self.assertTrue(os.path.exists(full_path(album.cover.name)))
+        for song in Song.objects.filter(album__artist=artist):
+            self.assertEqual(song.filefield.name, song.filepath)
+            self.assertTrue(os.path.exists(full_path(song.filepath)))
+
+    def test_sync_files(self):
+        # Simulate a rename whose files could not be moved
+        Song.objects.filter(pk=1).update(title='Spam', files_dirty=True)
+        song = Song.objects.get(pk=1)
+        original_filepath = song.filefield.name
+        self.assertNotEqual(original_filepath, song.filepath)
 
-        sync_song_files()
-        sync_cover_images()
+        sync_files()
 
-        self.assertTrue(os.path.exists(full_path(artist.filepath)))
-        self.assertTrue(
-            os.path.exists(
-                os.path.join(
-                    full_path(artist.filepath), 'The Album', 'cover.jpg')))
+        song = Song.objects.get(pk=1)
+        self.assertFalse(song.files_dirty)
+        self.assertEqual(song.filefield.name, song.filepath)
+        self.assertFalse(os.path.exists(full_path(original_filepath)))
+        self.assertTrue(os.path.exists(full_path(song.filepath)))
 
-    def test_remove_empty_directories(self):
+    def test_album_directory_moved_on_rename(self):
+        album = Album.objects.get(pk=1)
+        song = album.songs.all()[0]
+        inode = os.stat(full_path(song.filefield.name)).st_ino
+
+        album.title = 'Egg'
+        album.save()
+
+        song = Song.objects.get(pk=song.pk)
+        self.assertEqual(song.filefield.name, song.filepath)
+        self.assertEqual(os.stat(full_path(song.filepath)).st_ino, inode)
+        self.assertEqual(os.listdir(full_path(files.JOURNAL_DIR)), [])
+
+    def test_recover_interrupted_relocation(self):
+        storage = Song._meta.get_field('filefield').storage
         artist = Artist.objects.get(pk=1)
-        original_path = artist.filepath
+        old_path = artist.filepath
+        new_path = os.path.join('B', 'Brian')
+
+        # The directory was moved, but the paths were not updated
+        files._write_journal_entry(storage, old_path, new_path)
+        os.renames(full_path(old_path), full_path(new_path))
+
+        sync_files()
+
+        self.assertEqual(Artist.objects.get(pk=1).filepath, new_path)
+        for song in Song.objects.filter(album__artist=artist):
+            self.assertTrue(song.filefield.name.startswith(new_path))
+            self.assertTrue(os.path.exists(full_path(song.filefield.name)))
+        self.assertEqual(os.listdir(full_path(files.JOURNAL_DIR)), [])
+
+    def test_sync_files_after_interrupted_artist_rename(self):
+        # The artist was saved with its new path, but the process died
+        # before its directory was moved.
+        Artist.objects.filter(pk=1).update(
+            name='Brian', filepath=os.path.join('B', 'Brian'))
+        Album.objects.filter(artist=1).update(files_dirty=True)
+
+        sync_files()
+
+        for album in Album.objects.filter(artist=1):
+            self.assertEqual(album.filepath, album.build_filepath())
+            self.assertTrue(album.filepath.startswith(
+                os.path.join('B', 'Brian')))
+            for song in album.songs.all():
+                self.assertEqual(song.filefield.name, song.filepath)
+                self.assertTrue(
+                    os.path.exists(full_path(song.filefield.name)))
+        self.assertFalse(Album.objects.filter(files_dirty=True).exists())
+
+    def test_rollback_interrupted_relocation(self):
+        storage = Song._meta.get_field('filefield').storage
+        artist = Artist.objects.get(pk=1)
+        old_path = artist.filepath
 
-        artist.name = 'Brian'
-        artist.save()
-        sync_song_files()
-        sync_cover_images()
+        # The directory was not moved
+        files._write_journal_entry(
+            storage, old_path, os.path.join('B', 'Brian'))
 
-        self.assertTrue(os.path.exists(full_path(original_path)))
-        self.assertTrue(os.path.exists(full_path(artist.filepath)))
+        sync_files()
+
+        self.assertEqual(Artist.objects.get(pk=1).filepath, old_path)
+        for song in Song.objects.filter(album__artist=artist):
+            self.assertTrue(os.path.exists(full_path(song.filefield.name)))
+        self.assertEqual(os.listdir(full_path(files.JOURNAL_DIR)), [])
+
+    def test_remove_empty_directories(self):
+        artist = Artist.objects.get(pk=1)
+        empty_path = os.path.join(artist.filepath, 'Spam', 'Eggs')
+        os.makedirs(full_path(empty_path))
 
         remove_empty_directories()
 
-        self.assertFalse(os.path.exists(full_path(original_path)))
+        self.assertFalse(os.path.exists(full_path(empty_path)))
+        self.assertFalse(
+            os.path.exists(full_path(os.path.join(artist.filepath, 'Spam'))))
         self.assertTrue(os.path.exists(full_path(artist.filepath)))
 
     def test_delete_empty_instances(self):
@@ -172,3 +267,37 @@ class UtilsTest(TransactionTestCase):
         self.assertEqual(titlecase('Spam And Eggs'), 'Spam And Eggs')
         self.assertEqual(titlecase("spam'n eggs"), "Spam'n Eggs")
         self.assertEqual(titlecase('spàm é ôeufs'), 'Spàm É Ôeufs')
+
+    def _assert_zip_of_artist_folder(self, filename):
+        artist = Artist.objects.get(pk=1)
+        songs = Song.objects.filter(album__artist=artist)
+        expected = [s.filefield.name[2:] for s in songs]
+
+        self.assertTrue(zipfile.is_zipfile(filename))
+        with zipfile.ZipFile(filename, 'r') as z:
+            self.assertIsNone(z.testzip())
+            self.assertItemsEqual(z.namelist(), expected)
+            song = songs[0]
+            with open(full_path(song.filefield.name), 'rb') as f:
+                self.assertEqual(z.read(song.filefield.name[2:]), f.read())
+
+    def test_zip_folder(self):
+        artist = Artist.objects.get(pk=1)
+        zip_filename = os.path.join(TEST_DROPBOX_DIR, 'artist.zip')
+
+        zip_folder(full_path(artist.filepath), zip_filename)
+
+        self._assert_zip_of_artist_folder(zip_filename)
+
+    def test_zip_folder_with_zip64_records(self):
+        # Lower the limit so that every entry and offset uses ZIP64 records
+        artist = Artist.objects.get(pk=1)
+        zip_filename = os.path.join(TEST_DROPBOX_DIR, 'artist.zip')
+        original_limit = zipstream.ZIP64_LIMIT
+        zipstream.ZIP64_LIMIT = 1
+        try:
+            zip_folder(full_path(artist.filepath), zip_filename)
+        finally:
+            zipstream.ZIP64_LIMIT = original_limit
+
+        self._assert_zip_of_artist_folder(zip_filename)
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+import datetime
+import json
 import os
 import shutil
 import tempfile
@@ -10,9 +12,19 @@ from django.core.files.base import ContentFile
 from django.core.urlresolvers import reverse
 from django.test import TransactionTestCase
 from django.test.utils import override_settings
+from django.utils import timezone
 
-from .. import update
-from ..models import Artist, Album, Song, CustomStorage
+from haystack import connections
+
+try:
+    from PIL import Image
+except ImportError:
+    import Image
+
+from .. import jobs, search, update
+from ..models import (
+    Artist, Album, Song, CoverStorage, CustomStorage, DropboxEntry, ImportJob
+)
 
 
 TEST_MEDIA_DIR = tempfile.mkdtemp()
@@ -47,12 +59,16 @@ class ViewTest(TransactionTestCase):
         self._default_storage = self._field.storage
         test_storage = CustomStorage(location=self.media_dir)
         self._field.storage = test_storage
+        self._albumfield = Album._meta.get_field_by_name('cover')[0]
+        self._default_cover_storage = self._albumfield.storage
+        self._albumfield.storage = CoverStorage(location=self.media_dir)
 
     def tearDown(self):
         os.remove(self.logfile.name)
         shutil.rmtree(self.media_dir)
         shutil.rmtree(self.dropbox)
-        self._field = self._default_storage
+        self._field.storage = self._default_storage
+        self._albumfield.storage = self._default_cover_storage
 
     def assertNoLogError(self):
         """Asserts that nothing was written to the log file."""
@@ -136,11 +152,17 @@ class ViewTest(TransactionTestCase):
 
         with open(filename, 'rb') as f:
             original_content = f.read()
+        original_inode = os.stat(filename).st_ino
 
         # import file
         update.import_file(filename, self.mutagen_opts)
         song = Song.objects.get(title='The Song')
 
+        # the file was moved rather than copied
+        self.assertEqual(
+            os.stat(os.path.join(self.media_dir, song.filefield.name)).st_ino,
+            original_inode)
+
         self.assertEqual(song.title, 'The Song')
         self.assertEqual(song.album.title, 'The Album')
         self.assertEqual(song.album.artist.name, 'The Artist')
@@ -195,6 +217,145 @@ class ViewTest(TransactionTestCase):
 
         self.assertNoLogError()
 
+    def test_import_songs_creates_whole_batch(self):
+        # Put some files in dropbox
+        zipped_dropbox = os.path.join(TEST_FILES_DIR, 'test_dropbox.zip')
+        with zipfile.ZipFile(zipped_dropbox, 'r') as f:
+            f.extractall(self.dropbox)
+        items = [(f, update.get_file_info(f, self.mutagen_opts))
+                 for f in update.scan_dropbox()]
+
+        # Each model is looked up, bulk created and fetched back once.
+        with self.assertNumQueries(8):
+            imported = update.import_songs(items)
+
+        self.assertEqual(imported, 6)
+        self.assertEqual(Artist.objects.count(), 2)
+        self.assertEqual(Album.objects.count(), 4)
+        self.assertEqual(Song.objects.count(), 6)
+
+        song = Song.objects.get(title='The Fourth Song')
+        self.assertEqual(song.album.artist.name, 'The Artist')
+        self.assertEqual(song.album.filepath, 'T/The Artist/The Album')
+        self.assertTrue(os.path.exists(
+            os.path.join(self.media_dir, song.filefield.name)))
+        self.assertNoLogError()
+
+    def test_import_songs_keeps_batch_consistent_when_move_fails(self):
+        zipped_dropbox = os.path.join(TEST_FILES_DIR, 'test_dropbox.zip')
+        with zipfile.ZipFile(zipped_dropbox, 'r') as f:
+            f.extractall(self.dropbox)
+        items = [(f, update.get_file_info(f, self.mutagen_opts))
+                 for f in update.scan_dropbox()]
+        # A directory in the way of a song makes its file impossible to move
+        os.makedirs(os.path.join(
+            self.media_dir, 'T', 'The Artist', 'The Album',
+            '02 - The Second Song.ogg'))
+
+        imported = update.import_songs(items)
+
+        self.assertEqual(imported, 5)
+        self.assertEqual(Song.objects.count(), 5)
+        for song in Song.objects.all():
+            self.assertTrue(os.path.isfile(
+                os.path.join(self.media_dir, song.filefield.name)))
+        self.assertTrue(os.path.exists(
+            os.path.join(self.dropbox, 'The Artist', 'song2.ogg')))
+        with open(self.logfile.name, 'r') as f:
+            self.assertIn('song2.ogg', f.read())
+
+    def test_import_songs_updates_search_index(self):
+        connections['default'].get_backend().clear()
+        zipped_dropbox = os.path.join(TEST_FILES_DIR, 'test_dropbox.zip')
+        with zipfile.ZipFile(zipped_dropbox, 'r') as f:
+            f.extractall(self.dropbox)
+        items = [(f, update.get_file_info(f, self.mutagen_opts))
+                 for f in update.scan_dropbox()]
+
+        update.import_songs(items)
+        search.flush()
+
+        song = Song.objects.get(title='The Fourth Song')
+        response = self.client.get(reverse('search'), {'q': 'fourt'})
+        self.assertContains(response, song.get_absolute_url())
+        response = self.client.get(reverse('search'), {'q': 'the artist'})
+        self.assertContains(response, song.album.artist.get_absolute_url())
+
+    def test_search_index_removes_deleted_instances_at_once(self):
+        from haystack.backends.whoosh_backend import WhooshSearchBackend
+
+        connections['default'].get_backend().clear()
+        zipped_dropbox = os.path.join(TEST_FILES_DIR, 'test_dropbox.zip')
+        with zipfile.ZipFile(zipped_dropbox, 'r') as f:
+            f.extractall(self.dropbox)
+        update.update()
+        search.flush()
+        song = Song.objects.get(title='The Fourth Song')
+        url = song.get_absolute_url()
+        response = self.client.get(reverse('search'), {'q': 'fourt'})
+        self.assertContains(response, url)
+
+        removed = []
+        original = WhooshSearchBackend.remove
+        WhooshSearchBackend.remove = lambda self, *args, **kwargs: (
+            removed.append(args))
+        try:
+            song.album.artist.delete()
+            search.flush()
+        finally:
+            WhooshSearchBackend.remove = original
+
+        self.assertEqual(removed, [])
+        response = self.client.get(reverse('search'), {'q': 'fourt'})
+        self.assertNotContains(response, url)
+
+    def test_search_index_buffer_retries_failed_changes(self):
+        buf = search.IndexBuffer(100, 3600)
+        written = []
+        original = search._write
+
+        def fail(changes, containers):
+            raise RuntimeError('index locked')
+
+        def write(changes, containers):
+            written.append((changes, containers))
+
+        try:
+            search._write = fail
+            buf.update(Song, [1, 2], contents=True)
+            buf.flush()
+            # A change made after the failed flush takes precedence
+            buf.remove(Song, [2])
+            search._write = write
+            buf.close()
+        finally:
+            search._write = original
+
+        self.assertEqual(written, [(
+            {(Song, 1): True, (Song, 2): False},
+            set([(Song, 1), (Song, 2)]))])
+
+    def test_import_songs_keeps_one_copy_of_duplicates_in_batch(self):
+        # put test files in dropbox
+        shutil.copy(
+            os.path.join(TEST_FILES_DIR, 'testfile-128k.mp3'),
+            self.dropbox)
+        shutil.copy(os.path.join(TEST_FILES_DIR, 'testfile.mp3'), self.dropbox)
+        items = [(f, update.get_file_info(f, self.mutagen_opts))
+                 for f in sorted(update.scan_dropbox())]
+
+        imported = update.import_songs(items)
+
+        self.assertEqual(imported, 1)
+        self.assertEqual(Song.objects.count(), 1)
+        self.assertEqual(Song.objects.get().bitrate, 320000)
+
+        with open(self.logfile.name, 'r') as f:
+            log_record = f.read()
+
+        self.assertIn('testfile-128k.mp3', log_record)
+        self.assertIn('The Song by The Artist already exists', log_record)
+
     def test_importing_unsupported_format_gives_an_error(self):
         # put file in dropbox and import it
         shutil.copy(os.path.join(TEST_FILES_DIR, 'testfile.wav'), self.dropbox)
@@ -208,6 +369,60 @@ class ViewTest(TransactionTestCase):
         self.assertIn('testfile.wav (Mutagen could not read', log_record)
         self.assertTrue(os.path.exists(filename))
 
+    def test_update_skips_unchanged_files_that_failed_before(self):
+        # put file in dropbox and try to import it
+        shutil.copy(os.path.join(TEST_FILES_DIR, 'testfile.wav'), self.dropbox)
+        filename = os.path.join(self.dropbox, 'testfile.wav')
+        stats = update.update()
+
+        self.assertEqual(stats.failed, 1)
+        self.assertEqual(
+            list(DropboxEntry.objects.values_list('path', flat=True)),
+            ['testfile.wav'])
+
+        # the file is not read again as long as it is not modified
+        stats = update.update()
+        self.assertEqual(stats.failed, 0)
+        self.assertEqual(stats.skipped, 1)
+
+        with open(filename, 'ab') as f:
+            f.write('spam')
+        stats = update.update()
+        self.assertEqual(stats.failed, 1)
+        self.assertEqual(stats.skipped, 0)
+
+        # the entry is deleted once the file leaves the dropbox
+        os.remove(filename)
+        update.update()
+        self.assertFalse(DropboxEntry.objects.exists())
+
+    def test_update_skips_failed_files_removed_since_scan(self):
+        DropboxEntry.objects.create(
+            path='testfile.wav', size=1, mtime=0.0, inode=1)
+        filename = os.path.join(self.dropbox, 'testfile.wav')
+        stats = update.ImportStats()
+
+        to_read = update._filter_unchanged_files([filename], False, stats)
+
+        self.assertEqual(to_read, [])
+        self.assertEqual(stats.skipped, 0)
+        self.assertFalse(DropboxEntry.objects.exists())
+
+    def test_update_records_failed_files_with_long_paths(self):
+        directory = os.path.join(self.dropbox, *(['spam' * 20] * 4))
+        os.makedirs(directory)
+        shutil.copy(os.path.join(TEST_FILES_DIR, 'testfile.wav'), directory)
+        stats = update.update()
+
+        self.assertEqual(stats.failed, 1)
+        entry = DropboxEntry.objects.get()
+        self.assertGreater(len(entry.path), 255)
+        self.assertEqual(entry.path_hash, DropboxEntry.hash_path(entry.path))
+
+        stats = update.update()
+        self.assertEqual(stats.failed, 0)
+        self.assertEqual(stats.skipped, 1)
+
     def test_importing_dummy_file_removes_it_from_dropbox(self):
         # create the dummy file
         filename = os.path.join(self.dropbox, '.DS_Store')
@@ -221,6 +436,96 @@ class ViewTest(TransactionTestCase):
         self.assertFalse(os.path.exists(filename))
         self.assertNoLogError()
 
+    def test_embedded_cover_read_for_new_album(self):
+        from mutagen.id3 import ID3, APIC
+
+        filename = os.path.join(self.dropbox, 'testfile.mp3')
+        shutil.copy(os.path.join(TEST_FILES_DIR, 'testfile.mp3'), filename)
+        tags = ID3(filename)
+        tags.add(APIC(encoding=0, mime='image/jpeg', type=3, desc=u'',
+                      data='embedded cover'))
+        tags.save()
+
+        self.assertEqual(update.get_cover_data(filename), 'embedded cover')
+        update.import_file(filename, self.mutagen_opts)
+
+        album = Album.objects.get()
+        self.assertEqual(album.cover.read(), 'embedded cover')
+        self.assertNoLogError()
+
+    def test_update_builds_mutagen_options_once(self):
+        shutil.copy(os.path.join(TEST_FILES_DIR, 'testfile.mp3'), self.dropbox)
+        calls = []
+        original = update.get_mutagen_audio_options
+
+        def get_mutagen_audio_options():
+            calls.append(None)
+            return original()
+
+        update.get_mutagen_audio_options = get_mutagen_audio_options
+        try:
+            stats = update.update(workers=1)
+        finally:
+            update.get_mutagen_audio_options = original
+
+        self.assertEqual(stats.imported, 1)
+        self.assertEqual(len(calls), 1)
+
+    def test_update_uses_folder_image_as_cover(self):
+        # put a song without embedded cover art in a folder with images
+        folder = os.path.join(self.dropbox, 'The Album')
+        os.mkdir(folder)
+        shutil.copy(os.path.join(TEST_FILES_DIR, 'testfile.mp3'), folder)
+        shutil.copy(
+            os.path.join(TEST_FILES_DIR, 'cover.jpg'),
+            os.path.join(folder, 'Folder.jpg'))
+        with open(os.path.join(folder, 'back.png'), 'wb') as f:
+            f.write('x' * 100000)
+
+        update.update()
+
+        album = Album.objects.get()
+        with open(os.path.join(TEST_FILES_DIR, 'cover.jpg'), 'rb') as f:
+            self.assertEqual(album.cover.read(), f.read())
+        self.assertEqual(album.cover_file_type, 'jpg')
+        # the images are deleted along with the folder
+        self.assertFalse(os.path.exists(folder))
+        self.assertNoLogError()
+
+    def test_update_keeps_folder_image_of_failed_disc(self):
+        # an album split in a directory per disc, whose second disc fails
+        folder = os.path.join(self.dropbox, 'The Album')
+        for disc in ('CD1', 'CD2'):
+            os.makedirs(os.path.join(folder, disc))
+        shutil.copy(
+            os.path.join(TEST_FILES_DIR, 'testfile.mp3'),
+            os.path.join(folder, 'CD1'))
+        shutil.copy(
+            os.path.join(TEST_FILES_DIR, 'testfile.wav'),
+            os.path.join(folder, 'CD2'))
+        image = os.path.join(folder, 'folder.jpg')
+        shutil.copy(os.path.join(TEST_FILES_DIR, 'cover.jpg'), image)
+
+        stats = update.update()
+
+        self.assertEqual(stats.imported, 1)
+        self.assertEqual(stats.failed, 1)
+        self.assertTrue(os.path.exists(image))
+        self.assertFalse(os.path.exists(os.path.join(folder, 'CD1')))
+
+    def test_update_ignores_images_at_top_of_dropbox(self):
+        folder = os.path.join(self.dropbox, 'The Album')
+        os.mkdir(folder)
+        shutil.copy(os.path.join(TEST_FILES_DIR, 'testfile.mp3'), folder)
+        with open(os.path.join(self.dropbox, 'stray.png'), 'wb') as f:
+            f.write('x' * 100000)
+
+        update.update()
+
+        album = Album.objects.get()
+        with open(update.DEFAULT_ALBUM_COVER_IMAGE, 'rb') as f:
+            self.assertEqual(album.cover.read(), f.read())
+
     # TODO: check if user is authenticated
     def test_upload_dropbox_files_to_library(self):
         # Put some files in dropbox
@@ -243,9 +548,22 @@ class ViewTest(TransactionTestCase):
         # check that a message has been set in the cookie
         self.assertTrue('messages' in response.cookies.keys())
         self.assertIn(
-            'Library successfully updated',
+            'Library update scheduled',
             response.cookies.get('messages').value)
 
+        # The update is only run by the worker
+        job = ImportJob.objects.get()
+        self.assertEqual(job.status, ImportJob.PENDING)
+        self.assertEqual(Song.objects.count(), 0)
+
+        jobs.run_pending_jobs()
+
+        job = ImportJob.objects.get()
+        self.assertEqual(job.status, ImportJob.DONE)
+        self.assertEqual(job.files_total, 6)
+        self.assertEqual(job.files_done, 6)
+        self.assertEqual(job.errors, 0)
+
         # Check that the files have been imported
         self.assertNoLogError()
         self.assertEqual(os.listdir(self.dropbox), [])
@@ -254,12 +572,67 @@ class ViewTest(TransactionTestCase):
         self.assertEqual(Album.objects.count(), 4)
         self.assertEqual(Song.objects.count(), 6)
 
-        self.assertItemsEqual(os.listdir(self.media_dir), ['L', 'T'])
+        self.assertItemsEqual(
+            os.listdir(self.media_dir), ['.covers', 'L', 'T'])
         filename = os.path.join(
             self.media_dir, 'T', 'The Artist', 'The Album',
             '04 - The Fourth Song.ogg')
         self.assertTrue(os.path.exists(filename))
 
+    def test_update_library_enqueues_a_single_pending_job(self):
+        self.client.get(reverse('update_library'))
+        self.client.get(reverse('update_library'))
+        self.assertEqual(ImportJob.objects.count(), 1)
+
+    def test_abandon_only_jobs_of_dead_workers(self):
+        now = timezone.now()
+        alive = ImportJob.objects.create(
+            status=ImportJob.RUNNING, date_heartbeat=now)
+        dead = ImportJob.objects.create(
+            status=ImportJob.RUNNING,
+            date_heartbeat=now - datetime.timedelta(hours=1))
+
+        jobs.abandon_running_jobs()
+
+        alive = ImportJob.objects.get(pk=alive.pk)
+        self.assertEqual(alive.status, ImportJob.RUNNING)
+        dead = ImportJob.objects.get(pk=dead.pk)
+        self.assertEqual(dead.status, ImportJob.FAILED)
+
+    def test_update_status(self):
+        response = self.client.get(reverse('update_status'))
+        self.assertEqual(json.loads(response.content), {'status': None})
+
+        # Put a file in dropbox and run an update
+        shutil.copy(os.path.join(TEST_FILES_DIR, 'testfile.ogg'), self.dropbox)
+        jobs.enqueue_update()
+        jobs.run_pending_jobs()
+
+        response = self.client.get(reverse('update_status'))
+        self.assertEqual(response['Content-Type'], 'application/json')
+        status = json.loads(response.content)
+        self.assertEqual(status['status'], 'done')
+        self.assertEqual(status['files_total'], 1)
+        self.assertEqual(status['files_done'], 1)
+        self.assertEqual(status['errors'], 0)
+
+    def test_parallel_update_imports_dropbox_files(self):
+        # Put some files in dropbox
+        zipped_dropbox = os.path.join(TEST_FILES_DIR, 'test_dropbox.zip')
+        with zipfile.ZipFile(zipped_dropbox, 'r') as f:
+            f.extractall(self.dropbox)
+
+        stats = update.update(workers=2)
+
+        self.assertNoLogError()
+        self.assertEqual(os.listdir(self.dropbox), [])
+        self.assertEqual(stats.imported, 6)
+        self.assertEqual(stats.failed, 0)
+
+        self.assertEqual(Artist.objects.count(), 2)
+        self.assertEqual(Album.objects.count(), 4)
+        self.assertEqual(Song.objects.count(), 6)
+
     def test_download_artist(self):
         # Upload some files
         zipped_dropbox = os.path.join(TEST_FILES_DIR, 'test_dropbox.zip')
@@ -280,13 +653,75 @@ class ViewTest(TransactionTestCase):
         # check structure of returned zip file
         songs = Song.objects.filter(album__artist=1)
         original_song_names = [s.filefield.name[2:] for s in songs]
+        original_song_names += [
+            os.path.join(a.filepath[2:], 'cover.jpg')
+            for a in Album.objects.filter(artist=1)]
 
-        content = ContentFile(response.content)
+        content = ContentFile(b''.join(response.streaming_content))
         self.assertTrue(zipfile.is_zipfile(content))
         with zipfile.ZipFile(content, 'r') as z:
             self.assertIsNone(z.testzip())
             self.assertItemsEqual(z.namelist(), original_song_names)
 
+    def test_download_album_is_cached(self):
+        # Upload some files
+        zipped_dropbox = os.path.join(TEST_FILES_DIR, 'test_dropbox.zip')
+        with zipfile.ZipFile(zipped_dropbox, 'r') as f:
+            f.extractall(self.dropbox)
+        update.update()
+        cache_dir = os.path.join(self.dropbox, 'cache')
+
+        with self.settings(ARCHIVE_CACHE_DIR=cache_dir):
+            url = reverse('download_album', args=[1])
+            content = b''.join(self.client.get(url).streaming_content)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            cached_name = os.listdir(cache_dir)[0]
+            self.assertTrue(cached_name.startswith('album-1-'))
+
+            # The archive is now served from the cache
+            response = self.client.get(url)
+            self.assertEqual(
+                response['Content-Length'], str(len(content)))
+            self.assertEqual(b''.join(response.streaming_content), content)
+
+            with self.settings(ARCHIVE_SENDFILE_HEADER='X-Accel-Redirect'):
+                response = self.client.get(url)
+                self.assertEqual(
+                    response['X-Accel-Redirect'],
+                    '/protected/archives/' + cached_name)
+
+            # Saving a song of the album invalidates the archive
+            song = Song.objects.filter(album=1)[0]
+            song.title = 'Spam'
+            song.save()
+            self.assertEqual(os.listdir(cache_dir), [])
+
+    def test_album_cover_thumbnail(self):
+        # Upload some files
+        zipped_dropbox = os.path.join(TEST_FILES_DIR, 'test_dropbox.zip')
+        with zipfile.ZipFile(zipped_dropbox, 'r') as f:
+            f.extractall(self.dropbox)
+        update.update()
+
+        url = reverse('album_cover', args=[1, 150])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('max-age=', response['Cache-Control'])
+        image = Image.open(ContentFile(response.content))
+        self.assertEqual(max(image.size), 150)
+
+        # The thumbnail is only sent again if it changed
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        # The thumbnail is left out of the archive of the album
+        response = self.client.get(reverse('download_album', args=[1]))
+        content = ContentFile(b''.join(response.streaming_content))
+        with zipfile.ZipFile(content, 'r') as z:
+            self.assertFalse(
+                [name for name in z.namelist() if '-150' in name])
+
     def test_download_artist_with_no_songs_redirects_to_detail_view(self):
         # Create dummy artist
         a = Artist.objects.create(name='The Artist')
@@ -310,6 +745,54 @@ class ViewTest(TransactionTestCase):
     def test_download_updated_artist_retrieve_the_correct_file_structure(self):
         pass
 
+    def test_artist_list_shows_artists_of_one_initial(self):
+        for name in ['Brian', 'Spam', 'Bruce', 'Eggs']:
+            Artist.objects.create(name=name)
+
+        response = self.client.get(reverse('artist_list'))
+
+        self.assertEqual(
+            [(d['initial'], d['count']) for d in response.context['initials']],
+            [('B', 2), ('E', 1), ('S', 1)])
+        self.assertEqual(response.context['current_initial'], 'B')
+        self.assertEqual(
+            [a.name for a in response.context['object_list']],
+            ['Brian', 'Bruce'])
+
+        response = self.client.get(reverse('artist_list'), {'initial': 'S'})
+        self.assertEqual(
+            [a.name for a in response.context['object_list']], ['Spam'])
+
+    @override_settings(LIST_PAGE_SIZE=2)
+    def test_song_list_is_paginated_with_cursors(self):
+        artist = Artist.objects.create(name='Brian')
+        album = Album.objects.create(title='Spam', artist=artist)
+        for track, title in [('02', 'Eggs'), ('01', 'Spam'), ('01', 'Bacon'),
+                             ('03', 'Ham'), ('02', 'Beans')]:
+            Song.objects.create(
+                title=title, track=track, album=album, bitrate=128000)
+
+        titles = []
+        params = {'format': 'json'}
+        while True:
+            response = self.client.get(reverse('song_list'), params)
+            result = json.loads(response.content)
+            self.assertLessEqual(len(result['songs']), 2)
+            titles += [song['title'] for song in result['songs']]
+            if not result['next_cursor']:
+                break
+            params['cursor'] = result['next_cursor']
+
+        self.assertEqual(titles, ['Bacon', 'Spam', 'Beans', 'Eggs', 'Ham'])
+
+        response = self.client.get(reverse('song_list'), {'sort': 'title'})
+        self.assertEqual(
+            [song.title for song in response.context['object_list']],
+            ['Bacon', 'Beans'])
+
+        response = self.client.get(reverse('song_list'), {'cursor': 'spam'})
+        self.assertEqual(response.status_code, 404)
+
     def test_fetching_url_of_nonexisting_instance_redirects_to_list_view(self):
         response = self.client.get(reverse('artist_detail', args=[1]))
         self.assertEqual(response.status_code, 302)
@@ -321,3 +804,67 @@ class ViewTest(TransactionTestCase):
     def test_fetching_other_nonexisting_url_returns_404(self):
         response = self.client.get('/spam/and/eggs')
         self.assertEqual(response.status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_DIR, DROPBOX=TEST_DROPBOX_DIR)
+class QueryCountTest(TransactionTestCase):
+    """Check that the number of queries made by the library views does not
+    depend on the number of artists, albums or songs they show.
+    """
+
+    def setUp(self):
+        if not os.path.exists(TEST_MEDIA_DIR):
+            os.mkdir(TEST_MEDIA_DIR)
+        test_storage = CustomStorage(location=TEST_MEDIA_DIR)
+        self._songfield = Song._meta.get_field_by_name('filefield')[0]
+        self._albumfield = Album._meta.get_field_by_name('cover')[0]
+        self._default_storage = self._songfield.storage
+        self._default_cover_storage = self._albumfield.storage
+        self._songfield.storage = test_storage
+        self._albumfield.storage = CoverStorage(location=TEST_MEDIA_DIR)
+
+        self.artist = Artist.objects.create(name='The Artist')
+        for i in range(5):
+            album = Album(title='Album %d' % i, artist=self.artist,
+                          cover_file_type='jpg')
+            album.cover.save('cover.jpg', ContentFile('cover'), save=False)
+            album.save()
+            for j in range(5):
+                song = Song(title='Song %d' % j, album=album, bitrate=128000,
+                            filetype='ogg', first_save=True)
+                song.filefield.save('song.ogg', ContentFile('song'))
+        self.album = album
+        self.song = song
+
+    def tearDown(self):
+        shutil.rmtree(TEST_MEDIA_DIR)
+        self._songfield.storage = self._default_storage
+        self._albumfield.storage = self._default_cover_storage
+
+    def assertNumQueriesForGet(self, num, url, data=None):
+        with self.assertNumQueries(num):
+            response = self.client.get(url, data or {})
+            self.assertEqual(response.status_code, 200)
+
+    def test_artist_list(self):
+        self.assertNumQueriesForGet(3, reverse('artist_list'))
+
+    def test_artist_detail(self):
+        self.assertNumQueriesForGet(
+            2, reverse('artist_detail', args=[self.artist.pk]))
+
+    def test_album_list(self):
+        self.assertNumQueriesForGet(3, reverse('album_list'))
+
+    def test_album_detail(self):
+        self.assertNumQueriesForGet(
+            2, reverse('album_detail', args=[self.album.pk]))
+
+    def test_song_list(self):
+        self.assertNumQueriesForGet(1, reverse('song_list'))
+        self.assertNumQueriesForGet(
+            1, reverse('song_list'), {'format': 'json'})
+
+    def test_song_detail(self):
+        self.assertNumQueriesForGet(
+            1, reverse('song_detail', args=[self.song.pk]))
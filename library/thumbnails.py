@@ -0,0 +1,85 @@
+"""Resized renditions of the album covers.
+
+The thumbnails of a cover are stored next to it (as `<name>-150.jpg` for the
+150 pixels rendition of `<name>.png`), generated the first time they are
+requested. They are deleted along with their cover whenever it is moved or
+deleted, and are then generated again from the new cover.
+"""
+
+import logging
+import os
+import re
+import tempfile
+
+try:
+    from PIL import Image
+except ImportError:
+    import Image
+
+from django.conf import settings
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Matches the name of a thumbnail, with the name of its cover (without the
+# extension) as first group.
+THUMBNAIL_RE = re.compile(r'^(.*)-(\d+)\.jpg$')
+
+JPEG_QUALITY = 85
+
+
+def thumbnail_name(cover_name, size):
+    """Return the name of the thumbnail of `size` pixels of the cover named
+    `cover_name`.
+    """
+    return '%s-%d.jpg' % (os.path.splitext(cover_name)[0], size)
+
+
+def is_thumbnail(filename):
+    """Return whether the file `filename` is the thumbnail of a cover."""
+    match = THUMBNAIL_RE.match(os.path.basename(filename))
+    sizes = settings.COVER_THUMBNAIL_SIZES
+    return match is not None and int(match.group(2)) in sizes
+
+
+def get_thumbnail(cover, size):
+    """Return the full path of the thumbnail of `size` pixels of the image
+    field file `cover`, generating it if needed. Returns None if the cover
+    cannot be read.
+    """
+
+    storage = cover.storage
+    path = storage.path(thumbnail_name(cover.name, size))
+    cover_path = storage.path(cover.name)
+    try:
+        if os.path.getmtime(path) >= os.path.getmtime(cover_path):
+            return path
+    except OSError:
+        pass
+
+    try:
+        image = Image.open(cover_path)
+        image.thumbnail((size, size), Image.ANTIALIAS)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        # The thumbnail is written under a temporary name, so that a
+        # partially written one is never served.
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(path), suffix='.part')
+        with os.fdopen(fd, 'wb') as f:
+            image.save(f, 'JPEG', quality=JPEG_QUALITY)
+        os.rename(tmp_path, path)
+    except (IOError, OSError) as e:
+        LOGGER.error('Cannot make a thumbnail of "%s": %s' % (cover.name, e))
+        return None
+    return path
+
+
+def delete_thumbnails(storage, cover_name):
+    """Delete the thumbnails of the cover named `cover_name` in
+    `storage`.
+    """
+    for size in settings.COVER_THUMBNAIL_SIZES:
+        name = thumbnail_name(cover_name, size)
+        if storage.exists(name):
+            storage.delete(name)
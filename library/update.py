@@ -1,16 +1,22 @@
+import fcntl
 import logging
+import multiprocessing
 import os
 import re
-from collections import namedtuple
+import time
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
 
 import mutagen
 
 from django.conf import settings
 from django.core.files import File
 from django.core.files.base import ContentFile
-from django.db import IntegrityError
+from django.core.files.move import file_move_safe
+from django.db import IntegrityError, transaction
 
-from .models import Artist, Album, Song
+from . import files, search
+from .models import Artist, Album, Song, DropboxEntry, DropboxFile
 
 
 if settings.TITLECASE_ARTIST_AND_ALBUM_NAMES:
@@ -24,7 +30,13 @@ DEFAULT_ALBUM_COVER_IMAGE = os.path.join(
     settings.STATIC_ROOT, 'img', 'default-cover.jpg')
 
 SongInfo = namedtuple(
-    'SongInfo', ['title', 'artist', 'album', 'track', 'bitrate', 'cover_data'])
+    'SongInfo', ['title', 'artist', 'album', 'track', 'bitrate'])
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.gif', '.png')
+
+# Base names of the images of a folder that are preferred as cover art (in
+# order of preference). Otherwise the largest image of the folder is used.
+COVER_IMAGE_NAMES = ('folder', 'cover', 'front')
 
 
 def get_mutagen_audio_options():
@@ -73,39 +85,323 @@ def get_mutagen_audio_options():
     return audio_options
 
 
-def update():
+class FolderImages(object):
+    """Index of the images found in the directories of the dropbox, used
+    as cover art for the albums whose files have none embedded.
+    """
+
+    def __init__(self):
+        self.images = {}
+        self._covers = {}
+
+    def add(self, filename):
+        """Record the image `filename`."""
+        directory = os.path.dirname(filename)
+        self.images.setdefault(directory, []).append(filename)
+
+    def find_cover(self, filename):
+        """Return the image to use as cover art for the audio file
+        `filename`, or None if there is none. The image is taken from the
+        directory of the file or, for albums split in a directory per disc,
+        from its parent directory.
+        """
+        directory = os.path.dirname(filename)
+        cover = self._find_in(directory)
+        parent = os.path.dirname(directory)
+        # The images at the top of the dropbox belong to no album.
+        if (cover is None and parent != settings.DROPBOX and
+                parent.startswith(os.path.join(settings.DROPBOX, ''))):
+            cover = self._find_in(parent)
+        return cover
+
+    def _find_in(self, directory):
+        # The images of a directory are only compared once.
+        if directory not in self._covers:
+            self._covers[directory] = _best_cover_image(
+                self.images.get(directory, []))
+        return self._covers[directory]
+
+
+def _best_cover_image(filenames):
+    """Return the image of `filenames` that is the best candidate for the
+    cover art of an album, or None if there is none.
+    """
+
+    by_name = {}
+    for filename in filenames:
+        name = os.path.splitext(os.path.basename(filename))[0].lower()
+        by_name.setdefault(name, filename)
+    for name in COVER_IMAGE_NAMES:
+        if name in by_name:
+            return by_name[name]
+
+    sizes = []
+    for filename in filenames:
+        try:
+            sizes.append((os.path.getsize(filename), filename))
+        except OSError:
+            pass
+    return max(sizes)[1] if sizes else None
+
+
+class ImportStats(object):
+    """Counters describing the outcome of a library update."""
+
+    def __init__(self):
+        self.total = 0
+        self.imported = 0
+        self.failed = 0
+        self.skipped = 0
+        self.start_time = time.time()
+        self.end_time = None
+
+    @property
+    def processed(self):
+        return self.imported + self.failed
+
+    @property
+    def elapsed(self):
+        end_time = self.end_time or time.time()
+        return end_time - self.start_time
+
+    @property
+    def rate(self):
+        """Number of files processed per second."""
+        if not self.elapsed:
+            return 0.0
+        return self.processed / self.elapsed
+
+    def stop(self):
+        self.end_time = time.time()
+
+    def __str__(self):
+        return ('%d files processed in %.1fs (%.1f files/s): '
+                '%d imported, %d failed, %d skipped' % (
+                    self.processed, self.elapsed, self.rate,
+                    self.imported, self.failed, self.skipped))
+
+
+def update(workers=None, rescan=False, progress=None):
     """Import into the library all files in the directory structure
     rooted at `DROPBOX`.
 
     The files that are successfully imported are moved into the
     `MEDIA_ROOT` folder. The others are left in place, except for those
     whose name matches one in `DUMMY_FILES`, which are deleted.
+
+    The files left in place are recorded as `DropboxEntry` instances, and
+    are skipped by later updates as long as they are not modified (unless
+    `rescan` is True).
+
+    If given, `progress` is called with the `ImportStats` of the update
+    after each batch of files.
+
+    When `workers` (which defaults to `IMPORT_WORKERS`) is greater than
+    one, the tags of the files are read by a pool of that many processes.
+    The database is only written to by the calling process, in the order
+    in which the files were found.
+
+    A single update runs at a time (even across processes): an update
+    started while another one is running waits for it to finish.
+
+    Returns an `ImportStats` instance describing the update.
     """
 
+    with _update_lock():
+        return _update(workers, rescan, progress)
+
+
+@contextmanager
+def _update_lock():
+    """Hold an exclusive lock on `IMPORT_LOCK_FILE`, waiting for it to be
+    released if another process holds it.
+    """
+    with open(settings.IMPORT_LOCK_FILE, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _update(workers, rescan, progress):
+    if workers is None:
+        workers = settings.IMPORT_WORKERS
+
+    stats = ImportStats()
     mutagen_options = get_mutagen_audio_options()
+    images = FolderImages()
+    filenames = _filter_unchanged_files(scan_dropbox(images), rescan, stats)
+    stats.total = len(filenames)
+    if progress is not None:
+        progress(stats)
+
+    batch = []
+    for filename, info, error in _read_files(
+            filenames, mutagen_options, workers):
+        if error is not None:
+            handle_import_error(filename, error)
+            stats.failed += 1
+            continue
+        batch.append((filename, info))
+        if len(batch) >= settings.IMPORT_BATCH_SIZE:
+            _import_batch(batch, stats, progress, images, mutagen_options)
+            batch = []
+    if batch:
+        _import_batch(batch, stats, progress, images, mutagen_options)
+
+    _record_failed_files(filenames)
+
+    # The images are kept as long as files that might use them as cover
+    # art are left in their directory, or in one of its subdirectories for
+    # the albums split in a directory per disc.
+    kept = set()
+    for root, dirs, names in os.walk(settings.DROPBOX, topdown=False):
+        if (not all(_is_image(name) for name in names) or
+                any(os.path.join(root, name) in kept for name in dirs)):
+            kept.add(root)
+        else:
+            for name in names:
+                _remove_file(os.path.join(root, name))
+        try:
+            if root != settings.DROPBOX:
+                os.rmdir(root)
+        except OSError:
+            pass
+
+    search.flush()
+    stats.stop()
+    return stats
+
+
+def scan_dropbox(images=None):
+    """Return the list of the files in `DROPBOX` that are candidates for
+    import. Dummy files found along the way are deleted, and images are
+    added to `images` (a `FolderImages` instance) if given.
+    """
+
     pattern = '|'.join(settings.DUMMY_FILES)
     regex = re.compile(r'%s' % pattern)
+    filenames = []
     for root, dirs, files in os.walk(settings.DROPBOX, topdown=False):
         for name in files:
-            if re.match(regex, name) or name.endswith(
-                    ('jpg', 'jpeg', 'gif', 'png')):
-                #FIXME: keep images for get_cover_art
-                try:
-                    os.remove(os.path.join(root, name))
-                except OSError:
-                    pass
+            filename = os.path.join(root, name).decode('utf-8')
+            if re.match(regex, name):
+                _remove_file(filename)
+            elif _is_image(name):
+                if images is not None:
+                    images.add(filename)
             else:
-                filename = os.path.join(root, name).decode('utf-8')
-                import_file(filename, mutagen_options)
+                filenames.append(filename)
+    return filenames
+
+
+def _is_image(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def _remove_file(filename):
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+
+def _filter_unchanged_files(filenames, rescan, stats):
+    """Return the files in `filenames` that have to be read, i.e. those
+    that are not recorded as `DropboxEntry` instances or that were modified
+    since. The entries of the files to read and of the files that are no
+    longer in the dropbox are deleted.
+    """
+
+    entries = dict((entry.path, entry)
+                   for entry in DropboxEntry.objects.iterator())
+    to_read = []
+    for filename in filenames:
+        entry = entries.get(_get_original_path(filename))
+        if entry is None or rescan:
+            to_read.append(filename)
+            continue
         try:
-            if root != settings.DROPBOX:
-                os.rmdir(root)
+            stat = os.stat(filename)
         except OSError:
-            pass
+            # The file was removed from the dropbox since it was scanned.
+            continue
+        if entry.matches(stat):
+            del entries[entry.path]
+            stats.skipped += 1
+        else:
+            to_read.append(filename)
+
+    pks = [entry.pk for entry in entries.values()]
+    for i in range(0, len(pks), settings.IMPORT_BATCH_SIZE):
+        DropboxEntry.objects.filter(
+            pk__in=pks[i:i + settings.IMPORT_BATCH_SIZE]).delete()
+    return to_read
+
+
+def _record_failed_files(filenames):
+    """Record a `DropboxEntry` for each file of `filenames` that is still
+    in the dropbox, i.e. that could not be imported.
+    """
+
+    entries = []
+    for filename in filenames:
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            continue
+        entries.append(DropboxEntry(
+            path=_get_original_path(filename), size=stat.st_size,
+            mtime=stat.st_mtime, inode=stat.st_ino))
+    DropboxEntry.objects.bulk_create(entries)
+
+
+def _read_files(filenames, mutagen_options, workers):
+    """Generate a `(filename, info, error)` tuple for each of the files,
+    in order. `info` is None if the tags could not be read, in which case
+    `error` describes the problem.
+    """
+
+    if workers <= 1:
+        for filename in filenames:
+            yield _read_file(filename, mutagen_options)
+        return
+
+    pool = multiprocessing.Pool(workers, _init_worker)
+    try:
+        for result in pool.imap(_read_file_in_worker, filenames,
+                                chunksize=settings.IMPORT_CHUNK_SIZE):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _read_file(filename, mutagen_options):
+    try:
+        info = get_file_info(filename, mutagen_options)
+    except ValueError as e:
+        return filename, None, unicode(e)
+    return filename, info, None
+
+
+# Mutagen options of a worker process of the import pool.
+_worker_mutagen_options = None
+
+
+def _init_worker():
+    global _worker_mutagen_options
+    _worker_mutagen_options = get_mutagen_audio_options()
+
+
+def _read_file_in_worker(filename):
+    return _read_file(filename, _worker_mutagen_options)
 
 
 def import_file(filename, mutagen_options):
-    """Import the song referred to by filename into the library
+    """Import the song referred to by filename into the library.
+    Returns True if the song was imported.
 
     Arguments:
         filename - the filename of the audio file to import
@@ -113,13 +409,23 @@ def import_file(filename, mutagen_options):
     """
 
     try:
-        if filename.rsplit('.')[-1].lower() == 'wma':
-            info = get_wma_info(filename)
-        else:
-            info = get_song_info(filename, mutagen_options)
+        info = get_file_info(filename, mutagen_options)
     except ValueError as e:
         handle_import_error(filename, e)
-        return
+        return False
+
+    return import_song(filename, info, mutagen_options=mutagen_options)
+
+
+def import_song(filename, info, images=None, mutagen_options=None):
+    """Add the song described by `info` into the library, taking its
+    audio data from `filename`. Returns True if the song was imported.
+
+    If the song has no embedded cover art, the cover of a new album is
+    looked for in `images` (a `FolderImages` instance) if given. The
+    embedded cover art is read with the `mutagen_options` of the import
+    (see `get_cover_data`).
+    """
 
     artist_name = titlecase(info.artist)
     artist, created = Artist.objects.get_or_create(name=artist_name)
@@ -128,13 +434,12 @@ def import_file(filename, mutagen_options):
         title=titlecase(info.album), artist=artist)
 
     if created:
-        cover_img = get_cover_art(filename, info.cover_data)
-        album.cover_file_type = 'jpg'   # FIXME
+        cover_img = get_cover_art(filename, images, mutagen_options)
+        album.cover_file_type = _get_cover_file_type(cover_img)
         album.cover.save(album.cover.name, cover_img)
 
     filetype = filename.rsplit('.')[-1].lower()
-    original_path = filename.replace(settings.DROPBOX, '', 1
-                           ).lstrip(os.path.sep)
+    original_path = _get_original_path(filename)
 
     #TODO: Handle Unknown Title by Unknown Artist
     try:
@@ -142,32 +447,272 @@ def import_file(filename, mutagen_options):
             title=info.title,
             album=album,
             track=info.track,
-            defaults={'filefield': File(open(filename, 'rb')),
+            defaults={'filefield': DropboxFile(open(filename, 'rb')),
                       'bitrate': info.bitrate,
                       'filetype': filetype,
                       'original_path': original_path,
                       'first_save': True})
     except IntegrityError as e:
         handle_import_error(filename, e)
-        return
+        return False
 
     if not created:
         # Song already exists, keep only if better bitrate
         if song.bitrate >= info.bitrate:
             #FIXME: uncomment when Unknown songs are handled correctly
             #os.remove(filename)
-            handle_import_error(
-                filename,
-                '{info.title} by {info.artist} already exists'.format(info=info))
-            return
+            _report_existing_song(filename, info)
+            return False
         else:
             song.bitrate = info.bitrate
-            song.filefield = File(open(filename, 'rb'))
+            song.filefield = DropboxFile(open(filename, 'rb'))
             song.original_path = original_path
             song.first_save = True
             song.save()
 
-    os.remove(filename)
+    return True
+
+
+def _import_batch(batch, stats, progress, images, mutagen_options):
+    imported = import_songs(batch, images, mutagen_options)
+    stats.imported += imported
+    stats.failed += len(batch) - imported
+    if progress is not None:
+        progress(stats)
+
+
+def import_songs(items, images=None, mutagen_options=None):
+    """Import a batch of songs into the library. `items` is a list of
+    `(filename, info)` tuples, where `info` is the `SongInfo` of the file.
+    Returns the number of songs that were imported. The covers of the new
+    albums are looked for in `images` and read with `mutagen_options` as
+    for `import_song`.
+
+    Unlike `import_song`, the artists, albums and songs of the whole batch
+    are looked up with a single query per model, and the missing ones are
+    created with `bulk_create`. The batch is imported as a whole: if the
+    file of a new song cannot be moved into the media directory, or if the
+    batch conflicts with rows created concurrently, the files already moved
+    are put back into the dropbox and the songs are imported one by one
+    instead.
+    """
+
+    moved = []
+    try:
+        with transaction.commit_on_success():
+            new_songs, better_songs = _create_songs(
+                items, images, mutagen_options, moved)
+    except (IntegrityError, IOError, OSError):
+        _restore_files(moved)
+        return len([item for item in items
+                    if _import_song_alone(
+                        item[0], item[1], images, mutagen_options)])
+
+    _enqueue_index_updates([f.instance for f, filename in new_songs])
+
+    for song, filename, info in better_songs:
+        # Song already exists, but the new file has a better bitrate.
+        song.bitrate = info.bitrate
+        song.filefield = DropboxFile(open(filename, 'rb'))
+        song.original_path = _get_original_path(filename)
+        song.first_save = True
+        song.save()
+
+    return len(new_songs) + len(better_songs)
+
+
+def _import_song_alone(filename, info, images, mutagen_options):
+    try:
+        return import_song(filename, info, images, mutagen_options)
+    except (IOError, OSError) as e:
+        handle_import_error(filename, e)
+        return False
+
+
+def _store_files(new_songs, moved):
+    """Move the files of the `(fieldfile, filename)` tuples of `new_songs`
+    into the media directory, adding them to `moved` as they are moved.
+    """
+    for fieldfile, filename in new_songs:
+        content = DropboxFile(open(filename, 'rb'))
+        fieldfile.storage.save(fieldfile.name, content)
+        moved.append((fieldfile, filename))
+
+
+def _restore_files(moved):
+    """Put the files of the `(fieldfile, filename)` tuples of `moved` back
+    into the dropbox.
+    """
+    for fieldfile, filename in moved:
+        storage = fieldfile.storage
+        try:
+            file_move_safe(storage.path(fieldfile.name), filename)
+        except (IOError, OSError) as e:
+            LOGGER.error('Cannot put "%s" back into the dropbox: %s'
+                         % (fieldfile.name, e))
+            continue
+        files.remove_empty_parents(storage, fieldfile.name)
+
+
+def _enqueue_index_updates(songs):
+    """Schedule the update in the search index of the `songs` created with
+    `bulk_create` (which have no primary key), of their albums and of their
+    artists (which may have been created as well).
+    """
+    albums = set(song.album_id for song in songs)
+    search.enqueue_update(Album, albums, contents=True)
+    search.enqueue_update(
+        Artist, set(song.album.artist_id for song in songs))
+
+
+def _create_songs(items, images, mutagen_options, moved):
+    """Create the database rows for the new songs in `items` (see
+    `import_songs`), once their files are moved into the media directory
+    (and added to `moved`). Returns a list of `(fieldfile, filename)` tuples
+    for the files of the new songs, and a list of `(song, filename, info)`
+    tuples for the existing songs for which a file with a better bitrate was
+    found.
+    """
+
+    artists = _get_or_create_artists(
+        [titlecase(info.artist) for filename, info in items])
+    albums = _get_or_create_albums(items, artists, images, mutagen_options)
+
+    existing = Song.objects.filter(
+        album__in=set(album.pk for album in albums.values()),
+        title__in=set(info.title for filename, info in items))
+    songs = dict(((song.title, song.album_id, song.track), song)
+                 for song in existing)
+
+    # Map the key of each song to the file providing its data. The new
+    # songs are kept in order so that they are created in the order in
+    # which their files were found.
+    new_songs = OrderedDict()
+    better_songs = {}
+    for filename, info in items:
+        album = albums[(titlecase(info.artist), titlecase(info.album))]
+        key = (info.title, album.pk, info.track)
+        if key in new_songs or key in better_songs:
+            pending = new_songs if key in new_songs else better_songs
+            song, other_filename, other_info = pending[key]
+            if other_info.bitrate >= info.bitrate:
+                _report_existing_song(filename, info)
+            else:
+                _report_existing_song(other_filename, other_info)
+                pending[key] = (song, filename, info)
+        elif key not in songs:
+            new_songs[key] = (_make_song(info, album), filename, info)
+        elif songs[key].bitrate >= info.bitrate:
+            _report_existing_song(filename, info)
+        else:
+            better_songs[key] = (songs[key], filename, info)
+
+    # The song instances are shared between files of the same key, so the
+    # attributes taken from the file are only set once the best file is
+    # known.
+    for song, filename, info in new_songs.values():
+        song.bitrate = info.bitrate
+        song.filetype = filename.rsplit('.')[-1].lower()
+        song.original_path = _get_original_path(filename)
+        song.filefield = song.filepath
+
+    # The files are moved first, so that no row ever refers to a missing
+    # file.
+    stored = [(song.filefield, f) for song, f, i in new_songs.values()]
+    _store_files(stored, moved)
+    Song.objects.bulk_create([song for song, f, i in new_songs.values()])
+    return stored, better_songs.values()
+
+
+def _get_or_create_artists(names):
+    """Return a dict mapping each name in `names` to the corresponding
+    artist, creating the missing ones (in the order of `names`).
+    """
+
+    artists = dict((artist.name, artist)
+                   for artist in Artist.objects.filter(name__in=set(names)))
+    missing = []
+    for name in OrderedDict.fromkeys(names):
+        if name not in artists:
+            missing.append(Artist(name=name))
+    if missing:
+        for artist in missing:
+            artist.filepath = artist.build_filepath()
+            artist.initial = artist.build_initial()
+        Artist.objects.bulk_create(missing)
+        created = Artist.objects.filter(name__in=[a.name for a in missing])
+        artists.update((artist.name, artist) for artist in created)
+    return artists
+
+
+def _get_or_create_albums(items, artists, images, mutagen_options):
+    """Return a dict mapping `(artist name, album title)` to the
+    corresponding album for each song in `items`, creating the missing
+    albums. The cover art of a new album is taken from the first of its
+    songs in `items` (see `get_cover_art`).
+    """
+
+    wanted = OrderedDict()
+    for filename, info in items:
+        artist = artists[titlecase(info.artist)]
+        key = (artist.name, titlecase(info.album))
+        wanted.setdefault(key, (artist, filename, info))
+
+    albums = {}
+    existing = Album.objects.filter(
+        artist__in=set(artist.pk for artist, f, i in wanted.values()),
+        title__in=set(title for name, title in wanted))
+    names = dict((artist.pk, artist.name) for artist in artists.values())
+    for album in existing:
+        key = (names.get(album.artist_id), album.title)
+        if key in wanted:
+            albums[key] = album
+
+    missing = []
+    for key, (artist, filename, info) in wanted.items():
+        if key in albums:
+            continue
+        album = Album(title=key[1], artist=artist)
+        album.filepath = album.build_filepath()
+        album.initial = album.build_initial()
+        cover_img = get_cover_art(filename, images, mutagen_options)
+        album.cover_file_type = _get_cover_file_type(cover_img)
+        album.cover.save(album.cover.name, cover_img, save=False)
+        missing.append(album)
+
+    if missing:
+        Album.objects.bulk_create(missing)
+        created = Album.objects.filter(
+            filepath__in=[album.filepath for album in missing])
+        for album in created:
+            albums[(names[album.artist_id], album.title)] = album
+    return albums
+
+
+def _make_song(info, album):
+    return Song(title=info.title, album=album, track=info.track,
+                first_save=True)
+
+
+def _get_original_path(filename):
+    return filename.replace(settings.DROPBOX, '', 1).lstrip(os.path.sep)
+
+
+def _report_existing_song(filename, info):
+    handle_import_error(
+        filename,
+        '{info.title} by {info.artist} already exists'.format(info=info))
+
+
+def get_file_info(filename, mutagen_options):
+    """Returns a `SongInfo` describing the audio file referred to by
+    `filename`, whatever its format. Raises ValueError if the file
+    cannot be read.
+    """
+
+    if filename.rsplit('.')[-1].lower() == 'wma':
+        return get_wma_info(filename)
+    return get_song_info(filename, mutagen_options)
 
 
 def get_wma_info(filename):
@@ -209,7 +754,7 @@ def get_wma_info(filename):
     bitrate = audio.info.bitrate
 
     return SongInfo(title=title, artist=artist, album=album,
-                    track=track, bitrate=bitrate, cover_data=None)
+                    track=track, bitrate=bitrate)
 
 
 def _get_tag_field(container, tag_name):
@@ -243,7 +788,6 @@ def get_song_info(filename, mutagen_options):
     artist = _get_tag_field(audio, 'artist')
     album = _get_tag_field(audio, 'album')
     track = audio.get('tracknumber', [u''])[0]
-    cover_data = audio.get('cover', [None])[0]
 
     try:
         track = re.match(r'\d+', track).group()
@@ -259,15 +803,52 @@ def get_song_info(filename, mutagen_options):
         bitrate = 0
 
     return SongInfo(title=title, artist=artist, album=album,
-                    track=track, bitrate=bitrate, cover_data=cover_data)
+                    track=track, bitrate=bitrate)
 
 
-# TODO
-def get_cover_art(filename, existing_data=None):
-    if existing_data:
-        return ContentFile(existing_data)
-    else:
-        return File(open(DEFAULT_ALBUM_COVER_IMAGE, 'rb'))
+def get_cover_art(filename, images=None, mutagen_options=None):
+    """Return the cover art for the album of the audio file `filename`:
+    the art embedded in the file (read with `mutagen_options`), or else the
+    image of its folder found in `images` (a `FolderImages` instance), or
+    else the default cover.
+    """
+    cover_data = get_cover_data(filename, mutagen_options)
+    if cover_data:
+        return ContentFile(cover_data)
+    image = images.find_cover(filename) if images is not None else None
+    if image is not None:
+        return File(open(image, 'rb'))
+    return File(open(DEFAULT_ALBUM_COVER_IMAGE, 'rb'))
+
+
+def get_cover_data(filename, mutagen_options=None):
+    """Return the cover art embedded in the audio file `filename`, or None
+    if it has none or cannot be read.
+
+    The cover art is not part of the `SongInfo` of a file, since it is only
+    needed for the first song of a new album: it is read again from the
+    file then, instead of keeping the covers of every song in memory.
+    """
+
+    if filename.rsplit('.')[-1].lower() == 'wma':
+        return None
+    if mutagen_options is None:
+        mutagen_options = get_mutagen_audio_options()
+    try:
+        audio = mutagen.File(filename, options=mutagen_options)
+    except (RuntimeError, IOError):
+        return None
+    if audio is None:
+        return None
+    return audio.get('cover', [None])[0]
+
+
+def _get_cover_file_type(cover_img):
+    # The type of embedded cover art is not known, JPEG being the most
+    # common.
+    if cover_img.name:
+        return os.path.splitext(cover_img.name)[1][1:].lower()
+    return 'jpg'
 
 
 def handle_import_error(filename, error_msg):
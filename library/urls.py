@@ -2,11 +2,12 @@ from django.conf.urls import patterns, url
 
 from haystack.views import SearchView
 
+from .forms import LibrarySearchForm
 from .views import (
     ArtistListView, AlbumListView, SongListView,
     ArtistDetailView, AlbumDetailView, SongDetailView,
     LibraryHomeView, UpdateLibraryView,
-    download_artist, download_album,
+    download_artist, download_album, album_cover, update_status,
 )
 
 
@@ -20,12 +21,15 @@ urlpatterns = patterns('',
     url(r'^album/$', AlbumListView.as_view(), name='album_list'),
     url(r'^album/(?P<pk>\d+)/$', AlbumDetailView.as_view(), name='album_detail'),
     url(r'^album/(?P<pk>\d+)/download/$', download_album, name='download_album'),
+    url(r'^album/(?P<pk>\d+)/cover/(?P<size>\d+)/$', album_cover, name='album_cover'),
 
     url(r'^song/$', SongListView.as_view(), name='song_list'),
     url(r'^song/(?P<pk>\d+)/$', SongDetailView.as_view(), name='song_detail'),
 
     #FIXME: expose view to admin only
     url(r'^update/$', UpdateLibraryView.as_view(), name='update_library'),
+    url(r'^update/status/$', update_status, name='update_status'),
 
-    url(r'^search/', SearchView(), name='search'),
+    url(r'^search/', SearchView(form_class=LibrarySearchForm),
+        name='search'),
 )
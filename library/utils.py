@@ -1,10 +1,12 @@
 import os
-import zipfile
 
 from django.conf import settings
-from django.core.files.base import ContentFile
+from django.db.models import Count
 
-from .models import Artist, Album, Song
+from .models import (
+    Artist, Album, Song, COVERS_DIR, delete_cover, recover_relocations)
+from .thumbnails import is_thumbnail
+from .zipstream import folder_entries, stream_zip
 
 
 def full_path(name):
@@ -23,60 +25,31 @@ def zip_folder(src_path, dst_path):
     """Zip a directory structure at src_path into the file
     given by dst_path.
     """
-    zfile = zipfile.ZipFile(dst_path, 'w')
-    dirname = os.path.dirname(src_path) + os.path.sep
-    for root, dirs, files in os.walk(src_path, topdown=False):
-        for name in files:
-            full_name = os.path.join(root, name)
-            zfile.write(full_name, full_name.replace(dirname, '', 1))
-    zfile.close()
-
-
-def get_alphabetized_list(model):
-    """Returns a list of dict with keys 'initial' and 'instance', where
-    'instance' is an instance of the model given as input and 'initial' the
-    first letter of the unicode representation of the instance. The list
-    contains a dict for every instance of the model.
-
-    The output is meant to be used by the 'regroup' built-in template tag.
-    """
-    instances = model.objects.all()
-    thelist = [{'initial': unicode(instance)[0].upper(), 'instance': instance}
-               for instance in instances]
-    return sorted(thelist, key=lambda d: d['initial'])
-
+    with open(dst_path, 'wb') as f:
+        for chunk in stream_zip(folder_entries(src_path)):
+            f.write(chunk)
 
-def _sync_files(model, filefield_attr, filepath_attr, candidates=None):
-    """Synchronize the files in the media directory with their corresponding
-    model instances given in `candidates`. `filefield_attr` and `filepath_attr`
-    are the names of the instances attributes corresponding to the filefield to
-    be updated and the filepath of the file.
-    """
 
-    if not candidates:
-        candidates = model.objects.select_related().iterator()
-    for instance in candidates:
-        thefile = getattr(instance, filefield_attr)
-        current_path = thefile.name
-        correct_path = getattr(instance, filepath_attr)
-        if current_path != correct_path:
-            content = ContentFile(thefile.read())
-            thefile.delete(save=False)
-            thefile.save(correct_path, content)
-
-
-def sync_song_files(candidates=None):
-    """Ensure that each song instance in the candidates has its file field at
-    the right place in the media directory on the file system.
+def get_initials(model):
+    """Returns a list of dict with keys 'initial' and 'count', giving the
+    number of instances of the model listed under each letter. The list is
+    sorted by letter.
     """
-    _sync_files(Song, 'filefield', 'filepath', candidates)
+    queryset = model.objects.values('initial').annotate(count=Count('pk'))
+    return list(queryset.order_by('initial'))
 
 
-def sync_cover_images(candidates=None):
-    """Ensure that each album instance in the candidates has its cover image
-    file at the right place in the media directory on the file system.
+def sync_files():
+    """Move the files of the albums and songs flagged as dirty to their place
+    in the media directory. Files are normally moved as soon as the instances
+    are saved, so this only has to be done if that failed. The directory
+    moves that were interrupted are recovered first.
     """
-    _sync_files(Album, 'cover', 'cover_filepath', candidates)
+    recover_relocations()
+    for album in Album.objects.filter(files_dirty=True).select_related():
+        album.sync_files()
+    for song in Song.objects.filter(files_dirty=True).select_related():
+        song.sync_files()
 
 
 def remove_empty_directories(root=None):
@@ -108,3 +81,20 @@ def delete_empty_instances():
         if artist.albums.count() == 0:
             to_delete.append(artist.pk)
     Artist.objects.filter(id__in=to_delete).delete()
+
+
+def delete_unused_covers():
+    """Delete the covers of the cover store that no album uses anymore.
+    This is used by the `syncfiles` custom management command.
+    """
+    storage = Album._meta.get_field('cover').storage
+    used = set(Album.objects.values_list('cover', flat=True))
+    for dirpath, dirnames, filenames in os.walk(full_path(COVERS_DIR)):
+        for filename in filenames:
+            name = os.path.relpath(
+                os.path.join(dirpath, filename), settings.MEDIA_ROOT)
+            if filename.endswith('.part'):
+                # Cover being written.
+                continue
+            if name not in used and not is_thumbnail(name):
+                delete_cover(storage, name)
@@ -1,23 +1,24 @@
+import json
+import os
 import re
-import tempfile
 
+from django.conf import settings
 from django.contrib import messages
 from django.core.urlresolvers import reverse
-from django.http import HttpResponse
-from django.shortcuts import redirect
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from django.shortcuts import get_object_or_404, redirect
 from django.views import defaults
 from django.views.decorators.csrf import requires_csrf_token
 from django.views.generic import DetailView, ListView, TemplateView, View
+from django.utils.cache import patch_cache_control
 from django.utils.encoding import iri_to_uri
-from django.utils.http import urlquote
+from django.utils.http import parse_etags, quote_etag, urlquote
 from django.utils.translation import ugettext_lazy as _
 
-from . import update
-from .models import Artist, Album, Song
-from .utils import (
-    full_path, get_alphabetized_list, remove_empty_directories,
-    sync_cover_images, sync_song_files, zip_folder
-)
+from . import archives, jobs, thumbnails
+from .models import Artist, Album, Song, ImportJob
+from .pagination import InvalidCursor, KeysetPaginator
+from .utils import get_initials
 
 
 class LibraryHomeView(TemplateView):
@@ -25,9 +26,28 @@ class LibraryHomeView(TemplateView):
 
 
 class AlphabetizedListView(ListView):
+    """List the instances of the model listed under the letter given by the
+    `initial` query parameter (the first letter by default), along with the
+    letters under which there are instances.
+    """
+
+    def get(self, request, *args, **kwargs):
+        self.initials = get_initials(self.model)
+        self.initial = request.GET.get('initial')
+        if not self.initial and self.initials:
+            self.initial = self.initials[0]['initial']
+        return super(AlphabetizedListView, self).get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return self.model.objects.filter(initial=self.initial)
+
+    def get_paginate_by(self, queryset):
+        return settings.LIST_PAGE_SIZE
+
     def get_context_data(self, **kwargs):
         context = super(AlphabetizedListView, self).get_context_data(**kwargs)
-        context['alpha_list'] = get_alphabetized_list(self.model)
+        context['initials'] = self.initials
+        context['current_initial'] = self.initial
         return context
 
 
@@ -36,7 +56,7 @@ class ArtistListView(AlphabetizedListView):
 
 
 class ArtistDetailView(DetailView):
-    model = Artist
+    queryset = Artist.objects.prefetch_related('albums')
 
 
 class AlbumListView(AlphabetizedListView):
@@ -44,31 +64,94 @@ class AlbumListView(AlphabetizedListView):
 
 
 class AlbumDetailView(DetailView):
-    queryset = Album.objects.select_related()
+    queryset = Album.objects.select_related('artist').prefetch_related('songs')
 
 
 class SongListView(ListView):
-    queryset = Song.objects.select_related()
+    """List the songs of the library, a page at a time. The songs are sorted
+    by the key given by the `sort` query parameter, and the pages after the
+    first one are given by the `cursor` query parameter (see `pagination`).
+    The page is returned as JSON if the `format` query parameter is 'json'.
+    """
 
+    queryset = Song.objects.select_related('album__artist')
+    sort_keys = {
+        'track': ('track', 'title'),
+        'title': ('title',),
+    }
+
+    def get_paginate_by(self, queryset):
+        return settings.LIST_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, page_size):
+        self.sort = self.request.GET.get('sort')
+        if self.sort not in self.sort_keys:
+            self.sort = 'track'
+        paginator = KeysetPaginator(
+            queryset, self.sort_keys[self.sort], page_size)
+        try:
+            songs, self.next_cursor = paginator.page(
+                self.request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404(_('Invalid cursor'))
+        return (paginator, None, songs, self.next_cursor is not None)
 
-class SongDetailView(DetailView):
-    queryset = Song.objects.select_related()
+    def get_context_data(self, **kwargs):
+        context = super(SongListView, self).get_context_data(**kwargs)
+        context['sort'] = self.sort
+        context['next_cursor'] = self.next_cursor
+        return context
+
+    def render_to_response(self, context, **response_kwargs):
+        if self.request.GET.get('format') != 'json':
+            return super(SongListView, self).render_to_response(
+                context, **response_kwargs)
+
+        result = {
+            'songs': [{
+                'id': song.pk,
+                'title': song.title,
+                'track': song.track,
+                'album': song.album.title,
+                'artist': song.album.artist.name,
+                'url': song.get_absolute_url(),
+            } for song in context['object_list']],
+            'next_cursor': self.next_cursor,
+        }
+        data = json.dumps(result)
+        return HttpResponse(data, content_type='application/json')
 
-    # Ensure that the download url is up to date.
-    def get_object(self, queryset=None):
-        obj = super(SongDetailView, self).get_object(queryset)
-        sync_song_files([obj])
-        return obj
+
+class SongDetailView(DetailView):
+    queryset = Song.objects.select_related('album__artist')
 
 
 class UpdateLibraryView(View):
 
+    # The update itself is run by the `importworker` management command.
     def get(self, request, *args, **kwargs):
-        # TODO: run asynchronously using celery
-        update.update()
-        messages.info(request, _('Library successfully updated'))
+        jobs.enqueue_update()
+        messages.info(request, _('Library update scheduled'))
         return redirect(reverse('library_home'))
 
+
+def update_status(request):
+    """Return the progress of the latest library update as JSON."""
+    try:
+        job = ImportJob.objects.all()[0]
+    except IndexError:
+        result = {'status': None}
+    else:
+        result = {
+            'status': job.status,
+            'files_total': job.files_total,
+            'files_done': job.files_done,
+            'errors': job.errors,
+            'rate': job.rate,
+        }
+    data = json.dumps(result)
+    return HttpResponse(data, content_type='application/json')
+
 """
 def update_library(request):
     # TODO: run asynchronously using celery
@@ -78,22 +161,15 @@ def update_library(request):
 """
 
 
-def _download(instance):
+def _download(instance, songs):
     """Returns a HTTP response that is a ZIP file of the folder
-    at instance.filepath.
+    at instance.filepath, whose songs are given by the `songs` queryset.
+
+    The archive is built while it is sent, so that neither memory nor
+    temporary disk space is needed for it, and is cached for later
+    downloads (see `archives`).
     """
-    tfile = tempfile.NamedTemporaryFile(suffix='.zip')
-    zip_folder(full_path(instance.filepath), tfile.name)
-
-    # TODO: Use iterator instead in case data is too big for memory. This
-    # implies that the temporary file needs to stay on disk during download,
-    # and that it is deleted at some later time.
-    # OR use new http StreamingResponse
-    tfile.seek(0)
-    data = tfile.read()
-    tfile.close()
-
-    response = HttpResponse(data, content_type='application/zip')
+    response = archives.archive_response(instance, songs)
     filename = iri_to_uri(urlquote(unicode(instance)))
     response['Content-Disposition'] = \
         u'attachment; filename=%s.zip' % filename
@@ -107,10 +183,7 @@ def download_artist(request, pk):
         messages.info(request, _('The artist does not have any song'))
         return redirect(artist.get_absolute_url())
     else:
-        sync_song_files(Song.objects.filter(album__artist=artist))
-        sync_cover_images(artist.albums.all())
-        remove_empty_directories(artist.filepath)
-        return _download(artist)
+        return _download(artist, Song.objects.filter(album__artist=artist))
 
 
 def download_album(request, pk):
@@ -119,10 +192,37 @@ def download_album(request, pk):
         messages.info(request, _('The album does not have any song'))
         return redirect(album.get_absolute_url())
     else:
-        sync_song_files(album.songs.all())
-        sync_cover_images([album])
-        remove_empty_directories(album.filepath)
-        return _download(album)
+        return _download(album, album.songs.all())
+
+
+def album_cover(request, pk, size):
+    """Send the thumbnail of `size` pixels of the cover of an album. It can
+    be cached by browsers for `COVER_THUMBNAIL_MAX_AGE` seconds, and is then
+    revalidated with its ETag.
+    """
+
+    size = int(size)
+    if size not in settings.COVER_THUMBNAIL_SIZES:
+        raise Http404
+    album = get_object_or_404(Album, pk=pk)
+    if not album.cover:
+        raise Http404
+    path = thumbnails.get_thumbnail(album.cover, size)
+    if path is None:
+        return redirect(album.cover.url)
+
+    stat = os.stat(path)
+    etag = '%x-%x' % (int(stat.st_mtime), stat.st_size)
+    if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        response = HttpResponseNotModified()
+    else:
+        with open(path, 'rb') as f:
+            response = HttpResponse(f.read(), content_type='image/jpeg')
+        response['Content-Length'] = stat.st_size
+    response['ETag'] = quote_etag(etag)
+    patch_cache_control(
+        response, public=True, max_age=settings.COVER_THUMBNAIL_MAX_AGE)
+    return response
 
 
 @requires_csrf_token
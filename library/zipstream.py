@@ -0,0 +1,192 @@
+"""Generation of ZIP archives as a stream of chunks.
+
+The archives are written in a single pass and without seeking, so they can
+be sent to a client as they are built: the entries are stored uncompressed
+and their CRC is written after their data, in a data descriptor. ZIP64
+records are used for the entries and offsets that do not fit in the
+original format, so archives can be larger than 4 GB.
+"""
+
+import os
+import struct
+import time
+import zlib
+
+
+CHUNK_SIZE = 64 * 1024
+
+# Sizes and offsets from this value on are stored in ZIP64 records, their
+# original field holding `_ZIP64_MARKER` instead.
+ZIP64_LIMIT = 0xFFFFFFFF
+_ZIP64_MARKER = 0xFFFFFFFF
+
+# Maximum number of entries in an archive without ZIP64 records.
+ZIP_MAX_ENTRIES = 0xFFFF
+
+_LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+_DATA_DESCRIPTOR = struct.Struct('<IIII')
+_DATA_DESCRIPTOR64 = struct.Struct('<IIQQ')
+_CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+_END_RECORD = struct.Struct('<IHHHHIIH')
+_END_RECORD64 = struct.Struct('<IQHHIIQQQQ')
+_END_LOCATOR64 = struct.Struct('<IIQI')
+
+_LOCAL_HEADER_SIGNATURE = 0x04034b50
+_DATA_DESCRIPTOR_SIGNATURE = 0x08074b50
+_CENTRAL_HEADER_SIGNATURE = 0x02014b50
+_END_RECORD_SIGNATURE = 0x06054b50
+_END_RECORD64_SIGNATURE = 0x06064b50
+_END_LOCATOR64_SIGNATURE = 0x07064b50
+
+_ZIP64_EXTRA_ID = 0x0001
+
+# General purpose flags: sizes and CRC follow the data, UTF-8 file name.
+_FLAG_DATA_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+
+_VERSION = 20
+_VERSION64 = 45
+_CREATE_SYSTEM_UNIX = 3
+
+
+def folder_entries(src_path):
+    """Generate a `(filename, arcname)` tuple for each file of the directory
+    structure rooted at `src_path`. The archive names are relative to the
+    parent of `src_path`, so that the archive extracts to a single folder.
+    """
+    dirname = os.path.dirname(src_path) + os.path.sep
+    for root, dirs, files in os.walk(src_path):
+        dirs.sort()
+        for name in sorted(files):
+            full_name = os.path.join(root, name)
+            yield full_name, full_name.replace(dirname, '', 1)
+
+
+def stream_zip(entries, chunk_size=CHUNK_SIZE):
+    """Generate the content of a ZIP archive holding the files given by
+    `entries`, an iterable of `(filename, arcname)` tuples. Only one chunk
+    of a file is held in memory at a time.
+    """
+
+    offset = 0
+    records = []
+
+    for filename, arcname in entries:
+        stat = os.stat(filename)
+        name, flags = _encode_name(arcname)
+        flags |= _FLAG_DATA_DESCRIPTOR
+        dos_time, dos_date = _dos_datetime(stat.st_mtime)
+        zip64 = stat.st_size >= ZIP64_LIMIT
+
+        if zip64:
+            extra = struct.pack('<HHQQ', _ZIP64_EXTRA_ID, 16, 0, 0)
+            size_field = _ZIP64_MARKER
+        else:
+            extra = b''
+            size_field = 0
+        header = _LOCAL_HEADER.pack(
+            _LOCAL_HEADER_SIGNATURE, _VERSION64 if zip64 else _VERSION,
+            flags, 0, dos_time, dos_date, 0, size_field, size_field,
+            len(name), len(extra))
+        yield header + name + extra
+
+        crc = 0
+        size = 0
+        with open(filename, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                crc = zlib.crc32(chunk, crc)
+                size += len(chunk)
+                yield chunk
+        crc &= 0xFFFFFFFF
+
+        if zip64:
+            descriptor = _DATA_DESCRIPTOR64.pack(
+                _DATA_DESCRIPTOR_SIGNATURE, crc, size, size)
+        else:
+            descriptor = _DATA_DESCRIPTOR.pack(
+                _DATA_DESCRIPTOR_SIGNATURE, crc, size, size)
+        yield descriptor
+
+        records.append((name, flags, dos_time, dos_date, crc, size, offset,
+                        stat.st_mode))
+        offset += len(header) + len(name) + len(extra) + size
+        offset += len(descriptor)
+
+    cd_offset = offset
+    cd_size = 0
+    for record in records:
+        central_header = _central_header(*record)
+        cd_size += len(central_header)
+        yield central_header
+
+    yield _end_records(len(records), cd_size, cd_offset)
+
+
+def _central_header(name, flags, dos_time, dos_date, crc, size, offset,
+                    mode):
+    zip64_fields = []
+    if size >= ZIP64_LIMIT:
+        zip64_fields += [size, size]
+        size = _ZIP64_MARKER
+    if offset >= ZIP64_LIMIT:
+        zip64_fields.append(offset)
+        offset = _ZIP64_MARKER
+
+    if zip64_fields:
+        extra = struct.pack('<HH%dQ' % len(zip64_fields), _ZIP64_EXTRA_ID,
+                            8 * len(zip64_fields), *zip64_fields)
+        version = _VERSION64
+    else:
+        extra = b''
+        version = _VERSION
+
+    header = _CENTRAL_HEADER.pack(
+        _CENTRAL_HEADER_SIGNATURE, (_CREATE_SYSTEM_UNIX << 8) | version,
+        version, flags, 0, dos_time, dos_date, crc, size, size, len(name),
+        len(extra), 0, 0, 0, (mode & 0xFFFF) << 16, offset)
+    return header + name + extra
+
+
+def _end_records(count, cd_size, cd_offset):
+    records = b''
+    if (count > ZIP_MAX_ENTRIES or cd_size >= ZIP64_LIMIT or
+            cd_offset >= ZIP64_LIMIT):
+        end64_offset = cd_offset + cd_size
+        records += _END_RECORD64.pack(
+            _END_RECORD64_SIGNATURE, _END_RECORD64.size - 12, _VERSION64,
+            _VERSION64, 0, 0, count, count, cd_size, cd_offset)
+        records += _END_LOCATOR64.pack(
+            _END_LOCATOR64_SIGNATURE, 0, end64_offset, 1)
+        count = min(count, ZIP_MAX_ENTRIES)
+        if cd_size >= ZIP64_LIMIT:
+            cd_size = _ZIP64_MARKER
+        if cd_offset >= ZIP64_LIMIT:
+            cd_offset = _ZIP64_MARKER
+
+    records += _END_RECORD.pack(
+        _END_RECORD_SIGNATURE, 0, 0, count, count, cd_size, cd_offset, 0)
+    return records
+
+
+def _encode_name(arcname):
+    """Return the archive name as bytes, along with the flags describing
+    its encoding.
+    """
+    if isinstance(arcname, bytes):
+        return arcname, 0
+    try:
+        return arcname.encode('ascii'), 0
+    except UnicodeEncodeError:
+        return arcname.encode('utf-8'), _FLAG_UTF8
+
+
+def _dos_datetime(timestamp):
+    t = time.localtime(timestamp)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
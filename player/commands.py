@@ -0,0 +1,89 @@
+"""Batches of mpd commands, run in a single command list.
+
+A batch is a list of commands, each given as a list made of the name of the
+command followed by its arguments, e.g. `[["random", 1], ["next"]]`. Only
+the commands of `ALLOWED_COMMANDS` can be part of a batch.
+"""
+
+# Commands that can be run in a batch, with the number of arguments they
+# accept (as a `(minimum, maximum)` tuple).
+ALLOWED_COMMANDS = {
+    'add': (1, 1),
+    'addid': (1, 2),
+    'clear': (0, 0),
+    'consume': (1, 1),
+    'currentsong': (0, 0),
+    'delete': (1, 1),
+    'deleteid': (1, 1),
+    'load': (1, 1),
+    'move': (2, 2),
+    'moveid': (2, 2),
+    'next': (0, 0),
+    'pause': (1, 1),
+    'play': (0, 1),
+    'playid': (0, 1),
+    'playlistinfo': (0, 1),
+    'previous': (0, 0),
+    'random': (1, 1),
+    'repeat': (1, 1),
+    'rm': (1, 1),
+    'save': (1, 1),
+    'seek': (2, 2),
+    'seekid': (2, 2),
+    'setvol': (1, 1),
+    'shuffle': (0, 1),
+    'single': (1, 1),
+    'status': (0, 0),
+    'stop': (0, 0),
+}
+
+
+def parse_commands(data):
+    """Return the list of `(name, args)` tuples of the batch `data` (as
+    decoded from JSON). Raises ValueError if the batch is not valid.
+    """
+
+    if not isinstance(data, list) or not data:
+        raise ValueError('A batch must be a non-empty list of commands')
+
+    commands = []
+    for command in data:
+        if not isinstance(command, list) or not command:
+            raise ValueError('Invalid command: %r' % (command,))
+        name, args = command[0], command[1:]
+        if name not in ALLOWED_COMMANDS:
+            raise ValueError('Command not allowed: %r' % (name,))
+        minimum, maximum = ALLOWED_COMMANDS[name]
+        if not minimum <= len(args) <= maximum:
+            raise ValueError('Wrong number of arguments for %s' % name)
+        commands.append((name, [_encode_arg(arg) for arg in args]))
+    return commands
+
+
+def add_commands(uris):
+    """Return the commands adding the files with the given URIs (i.e. paths
+    relative to the music directory of mpd) to the queue.
+    """
+    return [('add', [_encode_arg(uri)]) for uri in uris]
+
+
+def run_command_list(client, commands):
+    """Send the `(name, args)` tuples of `commands` to mpd in a single
+    command list, using the connected `client`. Returns the list of their
+    results.
+    """
+    client.command_list_ok_begin()
+    for name, args in commands:
+        getattr(client, name)(*args)
+    return client.command_list_end()
+
+
+def _encode_arg(arg):
+    # The mpd client sends its arguments with `str`.
+    if isinstance(arg, unicode):
+        return arg.encode('utf-8')
+    if isinstance(arg, (int, long)) and not isinstance(arg, bool):
+        return arg
+    if isinstance(arg, str):
+        return arg
+    raise ValueError('Invalid argument: %r' % (arg,))
@@ -0,0 +1,2 @@
+# The player has no models. This module lets the test runner of Django find
+# the tests of the application.
@@ -0,0 +1,150 @@
+"""Pool of connections to the mpd server, shared by the player views.
+
+Connecting (and sending the password) on every request costs several round
+trips, which adds up since the player interface polls the server. The pool
+keeps authenticated connections open between requests instead.
+"""
+
+import socket
+import threading
+import time
+
+from mpd import MPDClient, CommandError, ConnectionError
+
+from django.conf import settings
+
+
+class PoolClient(MPDClient):
+    """MPD client recording in `sent` whether a command was written to the
+    server since it was last reset.
+    """
+
+    sent = False
+
+    def _write_line(self, line):
+        super(PoolClient, self)._write_line(line)
+        # Only set once written: a write that failed did not reach the
+        # server, whose end of the connection is closed.
+        self.sent = True
+
+
+class ConnectionPool(object):
+    """Thread-safe pool of connections to the mpd server at `host` and
+    `port`, authenticated with `password` if given.
+
+    At most `size` connections are kept open while unused. Commands time out
+    after `timeout` seconds, and connections that have been unused for more
+    than `ping_after` seconds are checked with a `ping` before being reused,
+    since the server closes idle connections.
+    """
+
+    def __init__(self, host, port, password=None, size=4, timeout=None,
+                 ping_after=10):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.size = size
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def run(self, func, idempotent=False):
+        """Return the result of `func(client)`, where `client` is a connected
+        `MPDClient`. If a connection taken from the pool turns out to be
+        broken before any command was sent, `func` is run again with a new
+        connection. If `idempotent` is True, it is run again even if
+        commands were sent, since running them twice is harmless.
+        """
+        client, reused = self._acquire()
+        while True:
+            client.sent = False
+            try:
+                result = func(client)
+            except CommandError:
+                # The server refused the command, the connection is fine.
+                self._release(client)
+                raise
+            except (ConnectionError, socket.error):
+                self._discard(client)
+                if not reused or (client.sent and not idempotent):
+                    raise
+                client, reused = self._connect(), False
+            except:
+                self._discard(client)
+                raise
+            else:
+                self._release(client)
+                return result
+
+    def query(self, func):
+        """Like `run`, for a `func` that does not change the state of the
+        server.
+        """
+        return self.run(func, idempotent=True)
+
+    def clear(self):
+        """Close every unused connection of the pool."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for client, last_used in idle:
+            self._discard(client)
+
+    def _acquire(self):
+        """Return a connection and whether it was taken from the pool."""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                client, last_used = self._idle.pop()
+            if time.time() - last_used < self.ping_after:
+                return client, True
+            try:
+                client.ping()
+            except (ConnectionError, socket.error):
+                self._discard(client)
+            else:
+                return client, True
+        return self._connect(), False
+
+    def _connect(self):
+        client = PoolClient()
+        client.connect(self.host, self.port)
+        try:
+            if self.timeout:
+                client._sock.settimeout(self.timeout)
+            if self.password:
+                client.password(self.password)
+        except:
+            self._discard(client)
+            raise
+        return client
+
+    def _release(self, client):
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append((client, time.time()))
+                return
+        self._discard(client)
+
+    def _discard(self, client):
+        try:
+            client.disconnect()
+        except (ConnectionError, socket.error):
+            pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the connection pool to the mpd server of the settings."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(
+                settings.MPD_HOST, settings.MPD_PORT, settings.MPD_PASSWORD,
+                size=settings.MPD_POOL_SIZE, timeout=settings.MPD_TIMEOUT,
+                ping_after=settings.MPD_PING_AFTER)
+    return _pool
@@ -0,0 +1,217 @@
+"""State of the player, cached and watched with the `idle` command of mpd.
+
+The state is cached for a short time, so that concurrent requests for it
+cost a single query to the server. A single thread per process also waits
+for the mpd server to report a change of the player or of its options, and
+wakes up the requests waiting for such a change (see
+`views.wait_for_change`). Clients thus get the new state as soon as it
+changes, instead of polling the server.
+
+The version of the state sent to the clients is derived from the state
+itself (see `state_version`), so that every process of the web server agrees
+on it: a client waiting for a change can be answered by any of them.
+"""
+
+import hashlib
+import json
+import logging
+import socket
+import threading
+import time
+
+from mpd import MPDClient, MPDError
+
+from django.conf import settings
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Subsystems of mpd whose changes affect the state returned by `fetch_state`.
+WATCHED_SUBSYSTEMS = ('player', 'options')
+
+
+def fetch_state(client):
+    """Return information about the currently playing song and the state of
+    the player, using the connected `client`.
+    """
+    song = client.currentsong()
+    status = client.status()
+    state = status.get('state')
+    random = status.get('random') == '1'
+    repeat = status.get('repeat') == '1'
+    return dict(song=song, state=state, random=random, repeat=repeat)
+
+
+def state_version(state):
+    """Return the version of the state `state` (as returned by
+    `fetch_state`, or None if the server cannot be reached), which is the
+    same in every process.
+    """
+    data = json.dumps(state, sort_keys=True)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()[:16]
+
+
+class StateCache(object):
+    """Process-wide cache of the state of the player, kept for `ttl` seconds.
+
+    Concurrent requests for a state that is not cached are coalesced: only
+    the first one fetches it, and the others wait for its result.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._state = None
+        self._expires = 0
+        self._flight = None
+
+    def get(self, fetch):
+        """Return the cached state, or the result of `fetch()` (which is
+        cached) if it has expired.
+        """
+        with self._lock:
+            if self._state is not None and time.time() < self._expires:
+                return self._state
+            flight = self._flight
+            leader = flight is None
+            if leader:
+                flight = self._flight = _Flight()
+
+        if not leader:
+            return flight.wait()
+
+        try:
+            flight.result = fetch()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                # The flight was detached if the cache was invalidated while
+                # fetching, in which case its result might be outdated.
+                if self._flight is flight:
+                    self._flight = None
+                    if flight.error is None:
+                        self._state = flight.result
+                        self._expires = time.time() + self.ttl
+            flight.done.set()
+        return flight.result
+
+    def invalidate(self):
+        """Forget the cached state, for instance after a command changed it."""
+        with self._lock:
+            self._state = None
+            self._flight = None
+
+
+class _Flight(object):
+    """A fetch of the state that other requests can wait for."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class StateWatcher(threading.Thread):
+    """Thread keeping track of the state of the player of the mpd server at
+    `host` and `port`, along with its `version` (see `state_version`).
+
+    While the server cannot be reached, the state is None and the connection
+    is attempted again every `retry_interval` seconds.
+    """
+
+    def __init__(self, host, port, password=None, retry_interval=5):
+        super(StateWatcher, self).__init__(name='mpd-state-watcher')
+        self.daemon = True
+        self.host = host
+        self.port = port
+        self.password = password
+        self.retry_interval = retry_interval
+        self.state = None
+        self.version = state_version(None)
+        self._condition = threading.Condition()
+
+    def run(self):
+        while True:
+            try:
+                self._watch()
+            except (MPDError, socket.error) as e:
+                LOGGER.warning('Lost connection to mpd: %s' % e)
+            self._publish(None)
+            time.sleep(self.retry_interval)
+
+    def wait(self, version, timeout):
+        """Wait until the version of the state is not `version` anymore, for
+        at most `timeout` seconds. Returns the current version and state.
+        """
+        deadline = time.time() + timeout
+        with self._condition:
+            while self.version == version:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return self.version, self.state
+
+    def _watch(self):
+        client = MPDClient()
+        client.connect(self.host, self.port)
+        try:
+            # The connection stays silent while idle, so rely on TCP to
+            # notice a server that went away.
+            client._sock.setsockopt(
+                socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            if self.password:
+                client.password(self.password)
+            while True:
+                self._publish(fetch_state(client))
+                client.idle(*WATCHED_SUBSYSTEMS)
+        finally:
+            try:
+                client.disconnect()
+            except (MPDError, socket.error):
+                pass
+
+    def _publish(self, state):
+        with self._condition:
+            if state != self.state:
+                self.state = state
+                self.version = state_version(state)
+                self._condition.notify_all()
+        if state is not None:
+            # The state might have been changed by another mpd client.
+            get_cache().invalidate()
+
+
+_cache = None
+_watcher = None
+_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the cache of the state of the player."""
+    global _cache
+    with _lock:
+        if _cache is None:
+            _cache = StateCache(settings.PLAYER_STATE_TTL)
+    return _cache
+
+
+def get_watcher():
+    """Return the watcher of the state of the mpd server of the settings,
+    starting it on first use.
+    """
+    global _watcher
+    with _lock:
+        if _watcher is None:
+            _watcher = StateWatcher(
+                settings.MPD_HOST, settings.MPD_PORT, settings.MPD_PASSWORD)
+            _watcher.start()
+    return _watcher
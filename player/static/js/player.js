@@ -1,9 +1,11 @@
 (function () {
     'use strict';
 
-    /* We can access this variable if we need to clear the
-     * update_display timeout. */
-    var update_timeout;
+    /* Version of the state of the player currently displayed. */
+    var version = '';
+
+    /* State of the player currently displayed. */
+    var current = null;
 
     /* Return the html for div#song-info. The input is a json object
      * describing the state of the music player. */
@@ -23,49 +25,101 @@
         return html;
     }
 
-    function update_display() {
-        $.get(vortex.urls.update, function (data) {
-
-            if (!data.success) {
-                $('#error-messages').empty();
-                $('#error-messages').html(
-                    '<div class="alert alert-error">\n'
-                  + '<button type="button" class="close" '
-                  + 'data-dismiss="alert">×</button>\n'
-                  + data.error + '\n</div>');
-                return;
-            }
+    function show_error(message) {
+        $('#error-messages').empty();
+        $('#error-messages').html(
+            '<div class="alert alert-error">\n'
+          + '<button type="button" class="close" '
+          + 'data-dismiss="alert">×</button>\n'
+          + message + '\n</div>');
+    }
 
-            // update currently playing song information.
-            $('#song-info').html(get_song_info_html(data));
+    function update_display(data) {
+        // update currently playing song information.
+        $('#song-info').html(get_song_info_html(data));
 
-            // update play-pause button according to the state.
-            $('#play-pause-button > i').toggleClass(
-                'icon-play', data.state !== 'play');
-            $('#play-pause-button > i').toggleClass(
-                'icon-pause', data.state === 'play');
+        // update play-pause button according to the state.
+        $('#play-pause-button > i').toggleClass(
+            'icon-play', data.state !== 'play');
+        $('#play-pause-button > i').toggleClass(
+            'icon-pause', data.state === 'play');
 
-            // update random and repeat buttons.
-            $('#random-button').toggleClass('active', data.random);
-            $('#repeat-button').toggleClass('active', data.repeat);
-        });
+        // update random and repeat buttons.
+        $('#random-button').toggleClass('active', data.random);
+        $('#repeat-button').toggleClass('active', data.repeat);
     }
 
+    /* Wait for the state of the player to change (the server answers as
+     * soon as it does), update the display and wait again. */
     function update_loop() {
-        if (vortex.refresh_rate === 0) {
-            return;
+        $.get(vortex.urls.wait, {version: version}, function (data) {
+            version = data.version;
+            if (data.success) {
+                $('#error-messages').empty();
+                current = data;
+                update_display(data);
+                update_loop();
+                return;
+            }
+            show_error(data.error);
+            retry();
+        }).fail(retry);
+    }
+
+    function retry() {
+        if (vortex.refresh_rate !== 0) {
+            window.setTimeout(update_loop, vortex.refresh_rate);
         }
-        update_display();
-        update_timeout = window.setTimeout(update_loop, vortex.refresh_rate);
     }
 
     function dispatch(url) {
         //TODO: Change to POST, take care of csrf token
-        $.get(url, function () {
-            update_display();
+        // The new state of the player is received by update_loop.
+        $.get(url, function (data) {
+            if (!data.success) {
+                show_error(data.error);
+            }
         });
     }
 
+    function get_cookie(name) {
+        var match = document.cookie.match(
+            new RegExp('(?:^|; )' + name + '=([^;]*)'));
+        return match ? decodeURIComponent(match[1]) : null;
+    }
+
+    /* Run the given mpd commands (e.g. [['random', 1], ['next']]) in a
+     * single request. The callback receives the list of their results. */
+    function batch(commands, callback) {
+        $.ajax({
+            url: vortex.urls.batch,
+            type: 'POST',
+            contentType: 'application/json',
+            data: JSON.stringify(commands),
+            headers: {'X-CSRFToken': get_cookie('csrftoken')},
+            dataType: 'json'
+        }).done(function (data) {
+            if (!data.success) {
+                show_error(data.error);
+            }
+            else if (callback) {
+                callback(data.results);
+            }
+        }).fail(function (xhr) {
+            show_error(xhr.responseText);
+        });
+    }
+
+    /* Toggle the given option of the player (random or repeat), using
+     * the displayed state instead of asking mpd for it first. */
+    function toggle(option, url) {
+        if (current === null) {
+            dispatch(url);
+            return;
+        }
+        batch([[option, current[option] ? 0 : 1]]);
+    }
+
     function addClickHandlers() {
         $('#play-pause-button').click(function () {
             dispatch(vortex.urls.play_pause);
@@ -77,18 +131,15 @@
             dispatch(vortex.urls.prev);
         });
         $('#random-button').click(function () {
-            dispatch(vortex.urls.random);
+            toggle('random', vortex.urls.random);
         });
         $('#repeat-button').click(function () {
-            dispatch(vortex.urls.repeat);
+            toggle('repeat', vortex.urls.repeat);
         });
     }
 
     $(document).ready(function () {
         addClickHandlers();
-        update_display();
-        if (vortex.refresh_rate !== 0) {
-            update_loop();
-        }
+        update_loop();
     });
 }());
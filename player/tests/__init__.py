@@ -0,0 +1,3 @@
+from .test_pool import *
+from .test_state import *
+from .test_commands import *
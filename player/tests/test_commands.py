@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+from django.test import SimpleTestCase
+
+from ..commands import add_commands, parse_commands, run_command_list
+
+
+class RecordingClient(object):
+    """Stand-in for an `MPDClient`, recording the commands it is given."""
+
+    def __init__(self):
+        self.calls = []
+
+    def command_list_ok_begin(self):
+        self.calls.append('begin')
+
+    def command_list_end(self):
+        self.calls.append('end')
+        return ['result']
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append((name, list(args)))
+
+
+class CommandsTest(SimpleTestCase):
+
+    def test_parse_commands(self):
+        commands = parse_commands(
+            [['clear'], ['add', u'T/The Artist/01 - Ünïcode.ogg'],
+             ['move', 0, 3], ['play']])
+
+        self.assertEqual(commands, [
+            ('clear', []),
+            ('add', ['T/The Artist/01 - \xc3\x9cn\xc3\xafcode.ogg']),
+            ('move', [0, 3]),
+            ('play', []),
+        ])
+        self.assertIsInstance(commands[1][1][0], str)
+
+    def test_batch_must_be_a_non_empty_list(self):
+        for data in [[], {}, 'play', None]:
+            self.assertRaises(ValueError, parse_commands, data)
+
+    def test_commands_must_be_non_empty_lists(self):
+        for command in [[], 'play', {'play': []}]:
+            self.assertRaises(ValueError, parse_commands, [command])
+
+    def test_command_not_allowed(self):
+        self.assertRaises(ValueError, parse_commands, [['kill']])
+        self.assertRaises(ValueError, parse_commands, [['update']])
+
+    def test_wrong_number_of_arguments(self):
+        self.assertRaises(ValueError, parse_commands, [['clear', 1]])
+        self.assertRaises(ValueError, parse_commands, [['move', 1]])
+        self.assertRaises(ValueError, parse_commands, [['add']])
+
+    def test_invalid_arguments(self):
+        for arg in [True, 1.5, None, [1], {'a': 1}]:
+            self.assertRaises(ValueError, parse_commands, [['setvol', arg]])
+
+    def test_add_commands(self):
+        self.assertEqual(
+            add_commands([u'a.ogg', u'é.ogg']),
+            [('add', ['a.ogg']), ('add', ['\xc3\xa9.ogg'])])
+
+    def test_run_command_list(self):
+        client = RecordingClient()
+
+        results = run_command_list(client, [('random', [1]), ('next', [])])
+
+        self.assertEqual(results, ['result'])
+        self.assertEqual(
+            client.calls,
+            ['begin', ('random', [1]), ('next', []), 'end'])
@@ -0,0 +1,132 @@
+from StringIO import StringIO
+
+from mpd import CommandError, ConnectionError
+
+from django.test import SimpleTestCase
+
+from ..pool import ConnectionPool, PoolClient
+
+
+class FakeClient(object):
+    """Stand-in for a connected `PoolClient`."""
+
+    def __init__(self):
+        self.sent = False
+        self.broken = False
+        self.disconnected = False
+
+    def ping(self):
+        if self.broken:
+            raise ConnectionError('Connection lost while reading line')
+
+    def disconnect(self):
+        self.disconnected = True
+
+
+class FakePool(ConnectionPool):
+    """Pool of `FakeClient` instances, recorded in `created`."""
+
+    def __init__(self, **kwargs):
+        super(FakePool, self).__init__('localhost', 6600, **kwargs)
+        self.created = []
+
+    def _connect(self):
+        client = FakeClient()
+        self.created.append(client)
+        return client
+
+
+def fail_on(broken, sent=False):
+    """Return a function failing as on a broken connection when given the
+    client `broken` (after sending a command if `sent` is True), and
+    returning 'ok' otherwise.
+    """
+    def func(client):
+        if client is broken:
+            client.sent = sent
+            raise ConnectionError('Connection lost while reading line')
+        return 'ok'
+    return func
+
+
+class ConnectionPoolTest(SimpleTestCase):
+
+    def test_connection_is_reused(self):
+        pool = FakePool()
+        first = pool.run(lambda client: client)
+        second = pool.run(lambda client: client)
+
+        self.assertIs(first, second)
+        self.assertEqual(len(pool.created), 1)
+
+    def test_pool_keeps_at_most_size_connections(self):
+        pool = FakePool(size=1)
+        # Both connections are used at once
+        pool.run(lambda client: pool.run(lambda other: other))
+
+        self.assertEqual(len(pool.created), 2)
+        # The inner connection is released first, and kept
+        self.assertEqual(len(pool._idle), 1)
+        self.assertEqual(
+            [client.disconnected for client in pool.created], [True, False])
+
+    def test_broken_connection_is_replaced_if_nothing_was_sent(self):
+        pool = FakePool()
+        broken = pool.run(lambda client: client)
+
+        self.assertEqual(pool.run(fail_on(broken)), 'ok')
+        self.assertEqual(len(pool.created), 2)
+        self.assertTrue(broken.disconnected)
+
+    def test_commands_are_not_sent_twice(self):
+        pool = FakePool()
+        broken = pool.run(lambda client: client)
+
+        self.assertRaises(
+            ConnectionError, pool.run, fail_on(broken, sent=True))
+        self.assertEqual(len(pool.created), 1)
+        self.assertTrue(broken.disconnected)
+
+    def test_queries_are_sent_again(self):
+        pool = FakePool()
+        broken = pool.run(lambda client: client)
+
+        self.assertEqual(pool.query(fail_on(broken, sent=True)), 'ok')
+        self.assertEqual(len(pool.created), 2)
+
+    def test_new_connection_is_not_retried(self):
+        pool = FakePool()
+        self.assertRaises(
+            ConnectionError, pool.query,
+            lambda client: fail_on(client, sent=True)(client))
+        self.assertEqual(len(pool.created), 1)
+
+    def test_command_error_keeps_connection(self):
+        pool = FakePool()
+
+        def refused(client):
+            raise CommandError('[50@0] {play} No such song')
+
+        self.assertRaises(CommandError, pool.run, refused)
+        self.assertEqual(len(pool._idle), 1)
+        self.assertFalse(pool.created[0].disconnected)
+
+    def test_idle_connection_is_checked_before_reuse(self):
+        pool = FakePool(ping_after=0)
+        broken = pool.run(lambda client: client)
+        broken.broken = True
+
+        client = pool.run(lambda client: client)
+
+        self.assertIsNot(client, broken)
+        self.assertTrue(broken.disconnected)
+
+    def test_client_records_sent_commands(self):
+        client = PoolClient()
+        client._wfile = StringIO()
+        self.assertFalse(client.sent)
+
+        client._write_command('status')
+
+        self.assertTrue(client.sent)
+        self.assertEqual(client._wfile.getvalue(), 'status\n')
@@ -0,0 +1,120 @@
+import threading
+import time
+
+from django.test import SimpleTestCase
+
+from ..state import StateCache, StateWatcher, state_version
+
+
+class Fetcher(object):
+    """Fetch function counting its calls, which can be made to block until
+    `release` is set, or to fail.
+    """
+
+    def __init__(self, block=False, error=None):
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        if not block:
+            self.release.set()
+        self.error = error
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return {'state': 'play', 'calls': self.calls}
+
+
+class StateCacheTest(SimpleTestCase):
+
+    def test_state_is_cached(self):
+        cache = StateCache(ttl=60)
+        fetch = Fetcher()
+
+        self.assertEqual(cache.get(fetch), cache.get(fetch))
+        self.assertEqual(fetch.calls, 1)
+
+    def test_state_expires(self):
+        cache = StateCache(ttl=0)
+        fetch = Fetcher()
+
+        cache.get(fetch)
+        cache.get(fetch)
+        self.assertEqual(fetch.calls, 2)
+
+    def test_invalidate(self):
+        cache = StateCache(ttl=60)
+        fetch = Fetcher()
+
+        cache.get(fetch)
+        cache.invalidate()
+        self.assertEqual(cache.get(fetch)['calls'], 2)
+
+    def _get_concurrently(self, cache, fetch, count):
+        """Call `cache.get(fetch)` from `count` threads while the first
+        fetch is blocked, and return the list of their results (or errors).
+        """
+        results = []
+
+        def get():
+            try:
+                results.append(cache.get(fetch))
+            except Exception as e:
+                results.append(e)
+
+        threads = [threading.Thread(target=get) for i in range(count)]
+        threads[0].start()
+        fetch.started.wait()
+        for thread in threads[1:]:
+            thread.start()
+        # Give the other threads the time to wait for the first fetch
+        time.sleep(0.1)
+        fetch.release.set()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_requests_share_a_fetch(self):
+        cache = StateCache(ttl=60)
+        fetch = Fetcher(block=True)
+
+        results = self._get_concurrently(cache, fetch, 4)
+
+        self.assertEqual(fetch.calls, 1)
+        self.assertEqual(results, [{'state': 'play', 'calls': 1}] * 4)
+
+    def test_fetch_error_is_shared_and_not_cached(self):
+        cache = StateCache(ttl=60)
+        error = IOError('Connection refused')
+        fetch = Fetcher(block=True, error=error)
+
+        results = self._get_concurrently(cache, fetch, 3)
+
+        self.assertEqual(fetch.calls, 1)
+        self.assertEqual(results, [error] * 3)
+        fetch.error = None
+        self.assertEqual(cache.get(fetch)['calls'], 2)
+
+
+class StateVersionTest(SimpleTestCase):
+
+    def test_version_depends_on_state_only(self):
+        state = {'song': {'title': 'The Song'}, 'state': 'play',
+                 'random': False, 'repeat': True}
+        self.assertEqual(state_version(state), state_version(dict(state)))
+        self.assertNotEqual(
+            state_version(state), state_version(dict(state, state='pause')))
+        self.assertNotEqual(state_version(state), state_version(None))
+
+    def test_wait_returns_at_once_for_other_version(self):
+        watcher = StateWatcher('localhost', 6600)
+        self.assertEqual(watcher.wait('other', 10), (watcher.version, None))
+
+    def test_wait_times_out_for_current_version(self):
+        watcher = StateWatcher('localhost', 6600)
+        start = time.time()
+        watcher.wait(watcher.version, 0.1)
+        self.assertGreaterEqual(time.time() - start, 0.1)
@@ -2,7 +2,8 @@ from django.conf.urls import patterns, url
 
 from .views import (
     play_pause, next, previous, random, repeat, get_current_info,
-    PlayerHomeView,
+    wait_for_change, batch, queue, enqueue_album, enqueue_artist, move_songs,
+    delete_songs, playlists, save_playlist, load_playlist, PlayerHomeView,
 )
 
 urlpatterns = patterns('',
@@ -14,4 +15,16 @@ urlpatterns = patterns('',
     url(r'random/$', random, name='random'),
     url(r'repeat/$', repeat, name='repeat'),
     url(r'update/$', get_current_info, name='get_current_info'),
+    url(r'wait/$', wait_for_change, name='wait_for_change'),
+    url(r'batch/$', batch, name='batch'),
+
+    url(r'queue/$', queue, name='queue'),
+    url(r'queue/album/(?P<pk>\d+)/$', enqueue_album, name='enqueue_album'),
+    url(r'queue/artist/(?P<pk>\d+)/$', enqueue_artist,
+        name='enqueue_artist'),
+    url(r'queue/move/$', move_songs, name='move_songs'),
+    url(r'queue/delete/$', delete_songs, name='delete_songs'),
+    url(r'playlists/$', playlists, name='playlists'),
+    url(r'playlists/save/$', save_playlist, name='save_playlist'),
+    url(r'playlists/load/$', load_playlist, name='load_playlist'),
 )
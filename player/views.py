@@ -1,16 +1,31 @@
 import json
 
-from mpd import MPDClient, MPDError, ConnectionError
+from mpd import MPDError
 
 from django.conf import settings
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.shortcuts import get_object_or_404
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import ensure_csrf_cookie
+from django.views.decorators.http import require_POST
 from django.views.generic import TemplateView
 from django.utils.translation import ugettext_lazy as _
 
+from library.models import Artist, Album, Song
+
+from .commands import add_commands, parse_commands, run_command_list
+from .pool import get_pool
+from .state import fetch_state, get_cache, get_watcher
+
 
 class PlayerHomeView(TemplateView):
     template_name = 'player/home.html'
 
+    # The CSRF token is needed by the POST requests of the interface.
+    @method_decorator(ensure_csrf_cookie)
+    def dispatch(self, *args, **kwargs):
+        return super(PlayerHomeView, self).dispatch(*args, **kwargs)
+
     def get_context_data(self, **kwargs):
         context = super(PlayerHomeView, self).get_context_data(**kwargs)
         context['REFRESH_INTERVAL'] = settings.PLAYER_REFRESH_INTERVAL
@@ -18,38 +33,40 @@ class PlayerHomeView(TemplateView):
 
 
 def mpd_command(func):
-    """Decorator for mpd commands. Handle connection, disconnection, error
-    catching and json conversion of output.
+    """Decorator for mpd commands. Handle connection (through the pool of
+    connections), error catching and json conversion of output.
     """
 
     def wrapper(request):
-        client = MPDClient()
         try:
-            client.connect(settings.MPD_HOST, settings.MPD_PORT)
-            if settings.MPD_PASSWORD:
-                client.password(settings.MPD_PASSWORD)
-            result = func(client) or {'success': True}
-        except (MPDError, IOError) as e:
-            result = {
-                'success': False,
-                'error': _(
-                    'Error while executing %(command)s: %(error_message)s'
-                ) % {'command': func.__name__, 'error_message': e}
-            }
+            return _json_response(func.__name__, get_pool().run, func)
         finally:
-            try:
-                client.close()
-                client.disconnect()
-            except ConnectionError:
-                pass
+            # The commands change the state of the player.
+            get_cache().invalidate()
 
-        # add a success key in the result dict if not already present.
-        result.setdefault('success', True)
+    return wrapper
 
-        data = json.dumps(result)
-        return HttpResponse(data, content_type='application/json')
 
-    return wrapper
+def _json_response(command, call, *args):
+    """Return a JSON response holding the result of `call(*args)`, or the
+    error it raised.
+    """
+    try:
+        # Copied, since the result might be shared (see `get_current_info`).
+        result = dict(call(*args) or {})
+    except (MPDError, IOError) as e:
+        result = {
+            'success': False,
+            'error': _(
+                'Error while executing %(command)s: %(error_message)s'
+            ) % {'command': command, 'error_message': e}
+        }
+
+    # add a success key in the result dict if not already present.
+    result.setdefault('success', True)
+
+    data = json.dumps(result)
+    return HttpResponse(data, content_type='application/json')
 
 
 @mpd_command
@@ -88,14 +105,170 @@ def repeat(client):
     client.repeat(1 - is_repeat)
 
 
-@mpd_command
-def get_current_info(client):
+def get_current_info(request):
     """Retrieve information about the currently playing song and the
-    state of the player.
+    state of the player. The information is cached for a short time (see
+    `state.StateCache`).
+    """
+    def fetch():
+        return get_pool().query(fetch_state)
+
+    return _json_response('get_current_info', get_cache().get, fetch)
+
+
+@require_POST
+def batch(request):
+    """Run the batch of commands given as a JSON list in the body of the
+    request (see `commands`) in a single command list, and return their
+    results.
+    """
+    try:
+        commands = parse_commands(json.loads(request.body))
+    except ValueError as e:
+        return _bad_request(e)
+    return _run_commands('batch', commands)
+
+
+def queue(request):
+    """Return the songs of the queue."""
+    return _json_response(
+        'queue', get_pool().query, lambda client: {
+            'songs': client.playlistinfo()})
+
+
+@require_POST
+def enqueue_album(request, pk):
+    """Add the songs of an album to the queue (see `_enqueue`)."""
+    album = get_object_or_404(Album, pk=pk)
+    return _enqueue(request, album.songs.all())
+
+
+@require_POST
+def enqueue_artist(request, pk):
+    """Add the songs of every album of an artist to the queue (see
+    `_enqueue`).
+    """
+    artist = get_object_or_404(Artist, pk=pk)
+    songs = Song.objects.filter(album__artist=artist).order_by(
+        'album__title', 'track', 'title')
+    return _enqueue(request, songs)
+
+
+def _enqueue(request, songs):
+    """Add the songs to the queue in a single command list. The queue is
+    cleared first if the `replace` POST parameter is set, and playback is
+    started if the `play` POST parameter is set.
+    """
+    commands = add_commands(songs.values_list('filefield', flat=True))
+    if request.POST.get('replace'):
+        commands.insert(0, ('clear', []))
+    if request.POST.get('play'):
+        commands.append(('play', []))
+    return _run_commands('enqueue', commands)
+
+
+@require_POST
+def move_songs(request):
+    """Move the songs of the queue at positions `start` to `end` (excluded)
+    to position `to`, given as POST parameters.
+    """
+    try:
+        start, end, to = [int(request.POST[key])
+                          for key in ('start', 'end', 'to')]
+    except (KeyError, ValueError):
+        return _bad_request(_('Invalid range of songs'))
+    return _run_commands('move', [('move', ['%d:%d' % (start, end), to])])
+
+
+@require_POST
+def delete_songs(request):
+    """Remove the songs of the queue at positions `start` to `end`
+    (excluded), given as POST parameters.
     """
-    song = client.currentsong()
-    status = client.status()
-    state = status.get('state')
-    random = status.get('random') == '1'
-    repeat = status.get('repeat') == '1'
-    return dict(song=song, state=state, random=random, repeat=repeat)
+    try:
+        start, end = [int(request.POST[key]) for key in ('start', 'end')]
+    except (KeyError, ValueError):
+        return _bad_request(_('Invalid range of songs'))
+    return _run_commands('delete', [('delete', ['%d:%d' % (start, end)])])
+
+
+def playlists(request):
+    """Return the stored playlists."""
+    return _json_response(
+        'playlists', get_pool().query, lambda client: {
+            'playlists': client.listplaylists()})
+
+
+@require_POST
+def save_playlist(request):
+    """Save the queue as the playlist named by the `name` POST parameter,
+    replacing any playlist of that name.
+    """
+    name = request.POST.get('name')
+    if not name:
+        return _bad_request(_('Missing playlist name'))
+    name = name.encode('utf-8')
+
+    def save(client):
+        commands = [('save', [name])]
+        if name in [p['playlist'] for p in client.listplaylists()]:
+            commands.insert(0, ('rm', [name]))
+        return {'results': run_command_list(client, commands)}
+
+    try:
+        return _json_response('save_playlist', get_pool().run, save)
+    finally:
+        get_cache().invalidate()
+
+
+@require_POST
+def load_playlist(request):
+    """Add the songs of the playlist named by the `name` POST parameter to
+    the queue, clearing it first if the `replace` POST parameter is set.
+    """
+    name = request.POST.get('name')
+    if not name:
+        return _bad_request(_('Missing playlist name'))
+    commands = [('load', [name.encode('utf-8')])]
+    if request.POST.get('replace'):
+        commands.insert(0, ('clear', []))
+    return _run_commands('load_playlist', commands)
+
+
+def _run_commands(command, commands):
+    """Return a JSON response holding the results of `commands`, run in a
+    single command list.
+    """
+    def run(client):
+        return {'results': run_command_list(client, commands)}
+
+    try:
+        return _json_response(command, get_pool().run, run)
+    finally:
+        get_cache().invalidate()
+
+
+def _bad_request(error):
+    data = json.dumps({'success': False, 'error': unicode(error)})
+    return HttpResponseBadRequest(data, content_type='application/json')
+
+
+def wait_for_change(request):
+    """Return the same information as `get_current_info` once it differs
+    from the version given by the `version` query parameter, or after
+    `PLAYER_WAIT_TIMEOUT` seconds. The response includes the version of the
+    information, to be given to the next request.
+    """
+    version = request.GET.get('version', '')
+    version, state = get_watcher().wait(version, settings.PLAYER_WAIT_TIMEOUT)
+    if state is None:
+        result = {
+            'success': False,
+            'error': _('Not connected to the mpd server'),
+        }
+    else:
+        result = dict(state, success=True)
+    result['version'] = version
+
+    data = json.dumps(result)
+    return HttpResponse(data, content_type='application/json')
@@ -1,5 +1,8 @@
 from __future__ import unicode_literals
 
+import os
+import tempfile
+
 from .utils import get_from_env
 
 
@@ -18,6 +21,70 @@ DUMMY_FILES = [r'\.DS_Store', r'Thumbs\.db', r'desktop\.ini', r'\._*']
 # Supported audio formats.
 SUPPORTED_FORMATS = ['mp3', 'mp4', 'ogg', 'flac', 'wma']
 
+# Number of processes used to read the tags of the files being imported
+# from the dropbox (1 means that everything is done in the main process).
+IMPORT_WORKERS = 1
+
+# Number of files handed at once to an import worker process.
+IMPORT_CHUNK_SIZE = 16
+
+# Number of files whose artists, albums and songs are created together
+# (with a handful of queries) during an import.
+IMPORT_BATCH_SIZE = 250
+
+# Number of seconds between checks for new library updates by the
+# `importworker` management command.
+IMPORT_WORKER_POLL_INTERVAL = 5
+
+# Number of seconds between the records by an `importworker` that the job it
+# runs is still alive.
+IMPORT_JOB_HEARTBEAT_INTERVAL = 10
+
+# Number of seconds after which a running job whose worker stopped sending
+# heartbeats is considered abandoned, and marked as failed.
+IMPORT_JOB_TIMEOUT = 120
+
+# File locked while the library is updated, so that a single update runs at a
+# time (it must be shared by every process running updates).
+IMPORT_LOCK_FILE = get_from_env(
+    'VORTEX_IMPORT_LOCK_FILE',
+    os.path.join(tempfile.gettempdir(), 'vortex-import.lock'))
+
+# Number of changes to the search index that are kept in memory before being
+# written with a single commit.
+SEARCH_INDEX_BUFFER_SIZE = 500
+
+# Number of seconds after which buffered changes to the search index are
+# written, even if the buffer is not full.
+SEARCH_INDEX_FLUSH_INTERVAL = 5
+
+# The directory in which the ZIP archives of downloaded artists and albums are
+# cached (leave empty to disable the cache).
+ARCHIVE_CACHE_DIR = get_from_env('VORTEX_ARCHIVE_CACHE_DIR', '')
+
+# Maximum total size (in bytes) of the cached archives. The least recently
+# downloaded ones are deleted first.
+ARCHIVE_CACHE_MAX_SIZE = 10 * 1024 ** 3
+
+# Header letting the web server send cached archives by itself:
+# 'X-Accel-Redirect' for nginx, 'X-Sendfile' for Apache or lighttpd (leave
+# empty to send the archives from Django).
+ARCHIVE_SENDFILE_HEADER = ''
+
+# With 'X-Accel-Redirect', the internal nginx location serving the files of
+# `ARCHIVE_CACHE_DIR`.
+ARCHIVE_CACHE_URL = '/protected/archives/'
+
+# Sizes (in pixels) of the thumbnails of the album covers.
+COVER_THUMBNAIL_SIZES = (150, 300)
+
+# Number of seconds during which browsers can use the thumbnails of the album
+# covers without checking whether they changed.
+COVER_THUMBNAIL_MAX_AGE = 7 * 24 * 3600
+
+# Number of artists or albums shown per page of their list.
+LIST_PAGE_SIZE = 200
+
 # The file used for logging.
 LOGFILE = get_from_env('VORTEX_LOGFILE', required=True)
 
@@ -34,5 +101,24 @@ MPD_HOST = get_from_env('MPD_HOST', 'localhost')
 MPD_PORT = int(get_from_env('MPD_PORT', 6600))
 MPD_PASSWORD = get_from_env('MPD_PASSWORD')
 
-# Time (in ms) between updating of player interface (put 0 for never).
+# Maximum number of unused connections to mpd kept open between requests.
+MPD_POOL_SIZE = 4
+
+# Time (in seconds) after which a command sent to mpd times out.
+MPD_TIMEOUT = 5
+
+# Time (in seconds) after which an unused connection to mpd is checked
+# before being used again (mpd closes idle connections after a while).
+MPD_PING_AFTER = 10
+
+# Time (in ms) before the player interface tries again to get updates after
+# an error (put 0 for never).
 PLAYER_REFRESH_INTERVAL = 5000
+
+# Time (in seconds) during which the state of the player is cached and shared
+# between requests.
+PLAYER_STATE_TTL = 1
+
+# Maximum time (in seconds) a request for updates of the player interface
+# waits for the state of the player to change.
+PLAYER_WAIT_TIMEOUT = 30
@@ -115,6 +115,10 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': True,
         },
+        'library.files': {
+            'handlers': ['vortex_log'],
+            'level': 'INFO'
+        },
         'library.models': {
             'handlers': ['vortex_log'],
             'level': 'INFO'
@@ -122,6 +126,18 @@ LOGGING = {
         'library.update': {
             'handlers': ['vortex_log'],
             'level': 'INFO'
+        },
+        'library.jobs': {
+            'handlers': ['vortex_log'],
+            'level': 'INFO'
+        },
+        'library.search': {
+            'handlers': ['vortex_log'],
+            'level': 'INFO'
+        },
+        'player': {
+            'handlers': ['vortex_log'],
+            'level': 'INFO'
         }
     }
 }
@@ -129,7 +145,11 @@ LOGGING = {
 # Haystack settings
 HAYSTACK_CONNECTIONS = {
     'default': {
-        'ENGINE': 'haystack.backends.simple_backend.SimpleEngine'
+        'ENGINE': 'haystack.backends.whoosh_backend.WhooshEngine',
+        'PATH': get_from_env(
+            'VORTEX_SEARCH_INDEX',
+            os.path.join(os.path.dirname(PROJECT_ROOT), 'whoosh_index')),
     }
 }
+HAYSTACK_SIGNAL_PROCESSOR = 'library.signals.BufferedSignalProcessor'
 HAYSTACK_SEARCH_RESULTS_PER_PAGE = 100
@@ -0,0 +1,7 @@
+from .base import *
+
+
+# The tests keep their search index in memory.
+HAYSTACK_CONNECTIONS = {
+    'default': dict(HAYSTACK_CONNECTIONS['default'], STORAGE='ram'),
+}